@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Single entry point for the BREATHE processing scripts.
+
+    breathe.py <command> [arguments...]
+
+Each command's module (and PyMuPDF, pandas or chardet behind it) is only
+imported when that command runs, so `--help` and no-op calls start fast.
+The same functions stay importable for in-process reuse, e.g.
+`from process_blood_analysis import process_pdf`.
+"""
+import sys
+import argparse
+import importlib
+
+# Command -> (module, description)
+COMMANDS = {
+    "blood": ("process_blood_analysis", "Extract blood analysis PDFs to CSV."),
+    "spirometry": ("process_spirometry", "Extract spirometry PDFs to CSV."),
+    "macro": ("transform_macro", "Split MACRO SubjectData exports by form."),
+    "meds": ("medication_lines_to_csv", "Convert medication lines to CSV."),
+    "revisio": (
+        "check_revisio_manual",
+        "List blood PDFs with a manual leukocyte review.",
+    ),
+    "reconcile": (
+        "reconcile",
+        "Compare automatic and manual blood and spirometry values.",
+    ),
+    "validate": ("validate", "Check extracted outputs against plausibility rules."),
+    "feno-ingest": ("feno_ingest", "Ingest FeNO exports into the Parquet store."),
+    "feno-features": ("feno_features", "Compute rolling FeNO features."),
+    "merge": ("shard", "Merge --shard outputs into the canonical CSV files."),
+    "serve": ("serve", "Serve the extracted outputs as a local JSON query service."),
+}
+
+
+def build_parser():
+    """Build the top-level parser; command arguments are parsed by each module."""
+    parser = argparse.ArgumentParser(
+        prog="breathe",
+        description="BREATHE data processing pipeline.",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    for name, (_, description) in COMMANDS.items():
+        subparsers.add_parser(name, help=description, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        parser = build_parser()
+        parser.parse_args(argv)
+        parser.print_help()
+        return
+
+    module_name, _ = COMMANDS[argv[0]]
+    module = importlib.import_module(module_name)
+    return module.main(argv[1:])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,29 @@
 import os
-import fitz  # PyMuPDF
+import argparse
 
 # Directory with the PDFs
-input_dir = r"C:/Users/fdjaramillo/Downloads/analitica-all-files"
+DEFAULT_INPUT_DIR = r"C:/Users/fdjaramillo/Downloads/analitica-all-files"
 
-# Initialize list to store files with "REVISIÓ LEUCOCITÀRIA MANUAL"
-files_with_revisio_manual = []
 
-# Process each PDF file
-for filename in os.listdir(input_dir):
-    if not filename.lower().endswith(".pdf"):
-        continue
+def parse_arguments(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="List blood analysis PDFs containing a manual leukocyte review."
+    )
+    parser.add_argument(
+        "input_dir",
+        nargs="?",
+        default=DEFAULT_INPUT_DIR,
+        help="Directory containing the source PDF files.",
+    )
+    return parser.parse_args(argv)
 
-    pdf_path = os.path.join(input_dir, filename)
 
-    try:
-        # Open the PDF
-        doc = fitz.open(pdf_path)
+def has_revisio_manual(pdf_path):
+    """Return True if a table row starts with "REVISIÓ LEUCOCITÀRIA MANUAL"."""
+    import fitz  # PyMuPDF
 
+    with fitz.open(pdf_path) as doc:
         # Check each page for the target value
         for page in doc:
             for table in page.find_tables():
@@ -26,20 +32,44 @@ for filename in os.listdir(input_dir):
                         continue
 
                     # Check if the first column contains "REVISIÓ LEUCOCITÀRIA MANUAL"
-                    if row[0].strip() == "REVISIÓ LEUCOCITÀRIA MANUAL":
-                        files_with_revisio_manual.append(filename)
-                        raise StopIteration  # Stop further processing of this file
-
-    except StopIteration:
-        pass  # Continue to the next file
-    except Exception as e:
-        print(f"[ERROR] Failed to process {filename}: {e}")
-        continue
-
-# Print summary
-if files_with_revisio_manual:
-    print("Files containing 'REVISIÓ LEUCOCITÀRIA MANUAL':")
-    for fname in files_with_revisio_manual:
-        print(f" - {fname}")
-else:
-    print("No files contain 'REVISIÓ LEUCOCITÀRIA MANUAL'.")
+                    if row[0] and row[0].strip() == "REVISIÓ LEUCOCITÀRIA MANUAL":
+                        return True
+    return False
+
+
+def find_revisio_manual(input_dir):
+    """Return the PDF file names in the directory with a manual leukocyte review."""
+    files_with_revisio_manual = []
+
+    # Process each PDF file
+    for filename in os.listdir(input_dir):
+        if not filename.lower().endswith(".pdf"):
+            continue
+
+        pdf_path = os.path.join(input_dir, filename)
+
+        try:
+            if has_revisio_manual(pdf_path):
+                files_with_revisio_manual.append(filename)
+        except Exception as e:
+            print(f"[ERROR] Failed to process {filename}: {e}")
+            continue
+
+    return files_with_revisio_manual
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    files_with_revisio_manual = find_revisio_manual(args.input_dir)
+
+    # Print summary
+    if files_with_revisio_manual:
+        print("Files containing 'REVISIÓ LEUCOCITÀRIA MANUAL':")
+        for fname in files_with_revisio_manual:
+            print(f" - {fname}")
+    else:
+        print("No files contain 'REVISIÓ LEUCOCITÀRIA MANUAL'.")
+
+
+if __name__ == "__main__":
+    main()
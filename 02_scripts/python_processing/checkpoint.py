@@ -0,0 +1,215 @@
+import os
+import csv
+import glob
+import json
+from utils import append_csv_atomic
+from columnar import ColumnarTable
+
+CHECKPOINT_DIR = ".checkpoint"
+STATE_FILE = "state.json"
+PROCESSED_FILE = "processed.txt"
+
+
+def parquet_dir(path):
+    """Return the Parquet dataset directory written next to an output CSV."""
+    return f"{os.path.splitext(path)[0]}.parquet"
+
+
+def add_checkpoint_arguments(parser):
+    """Add the shared --chunk-size/--resume options to an extractor's argument parser."""
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=50,
+        help="Number of input files buffered before results are flushed (default: 50).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run, skipping files already flushed.",
+    )
+    parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help="Also write every output as a Parquet dataset next to its CSV "
+        "(<name>.parquet/part-*.parquet, one part per flushed chunk).",
+    )
+
+
+class CheckpointedWriter:
+    """
+    Stream extraction results to CSV outputs in chunks, with resume support.
+
+    Rows are buffered in columnar tables for `chunk_size` input files, then
+    appended to the outputs. With `parquet`, each flushed chunk is also
+    written from the same buffers as one Parquet part per output. After
+    each flush a state file records the size of every output, the number
+    of Parquet parts and the number of input files done. The state file is
+    replaced in one rename, so it always describes a consistent point. On resume the
+    outputs are truncated back to that point (later parts are deleted) and
+    the recorded files are skipped, so a crash during a flush never leaves
+    duplicated rows.
+
+    Args:
+        tables (dict): key -> (output path, fieldnames).
+        output_dir (str): Directory where the checkpoint is kept.
+        chunk_size (int): Input files per flush.
+        resume (bool): Continue from an existing checkpoint. Parquet parts
+            are written if the interrupted run wrote them.
+        parquet (bool): Also write Parquet parts (needs pyarrow).
+
+    Set `atomic` to True when outputs are read while being written (watch
+    mode): each flush then replaces the outputs in one rename instead of
+    appending in place.
+    """
+
+    def __init__(self, tables, output_dir, chunk_size=50, resume=False, parquet=False):
+        self.tables = tables
+        self.chunk_size = max(1, chunk_size)
+        self.atomic = False
+        self.checkpoint_dir = os.path.join(output_dir, CHECKPOINT_DIR)
+        self.state_path = os.path.join(self.checkpoint_dir, STATE_FILE)
+        self.processed_path = os.path.join(self.checkpoint_dir, PROCESSED_FILE)
+        self.processed = set()
+        self._buffer = {
+            key: ColumnarTable(fieldnames) for key, (_, fieldnames) in tables.items()
+        }
+        self._pending = []
+        self._n_files = 0
+        self.parquet = parquet
+        self._n_parts = 0
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        if resume and os.path.isfile(self.state_path):
+            self._restore()
+        else:
+            self._start()
+
+    def _start(self):
+        """Write empty outputs (header only) and a fresh checkpoint."""
+        for path, fieldnames in self.tables.values():
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.DictWriter(f, fieldnames=fieldnames).writeheader()
+            if self.parquet:
+                self._remove_parts(path)
+                os.makedirs(parquet_dir(path), exist_ok=True)
+        open(self.processed_path, "w", encoding="utf-8").close()
+        self._save_state()
+
+    def _restore(self):
+        """Roll outputs back to the last checkpoint and load the processed files."""
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        for key, (path, fieldnames) in self.tables.items():
+            offset = state["offsets"].get(key)
+            if offset is None or not os.path.isfile(path):
+                with open(path, "w", newline="", encoding="utf-8") as f:
+                    csv.DictWriter(f, fieldnames=fieldnames).writeheader()
+            elif os.path.getsize(path) > offset:
+                os.truncate(path, offset)
+
+        parquet = state.get("parquet", False)
+        if parquet != self.parquet:
+            print(f"⚠️ Parquet output {'on' if parquet else 'off'}, as in the interrupted run.")
+        self.parquet = parquet
+        self._n_parts = state.get("parts", 0)
+        if self.parquet:
+            for path, _ in self.tables.values():
+                self._remove_parts(path, first=self._n_parts)
+                os.makedirs(parquet_dir(path), exist_ok=True)
+
+        with open(self.processed_path, "r", encoding="utf-8") as f:
+            names = [line.rstrip("\n") for line in f][: state["files"]]
+        with open(self.processed_path, "w", encoding="utf-8") as f:
+            f.writelines(f"{name}\n" for name in names)
+        self.processed = set(names)
+        self._n_files = len(names)
+        print(f"⏩ Resuming: {self._n_files} files already processed.")
+
+    def _remove_parts(self, path, first=0):
+        """Delete the Parquet parts of an output from number `first` on."""
+        for part in glob.glob(os.path.join(parquet_dir(path), "part-*.parquet")):
+            if int(os.path.basename(part)[5:-8]) >= first:
+                os.remove(part)
+
+    def _write_parts(self):
+        """Write the buffered rows of every output as its next Parquet part."""
+        import pyarrow.parquet as pq
+
+        for key, (path, fieldnames) in self.tables.items():
+            rows = self._buffer[key]
+            if not len(rows):
+                continue
+            part = os.path.join(parquet_dir(path), f"part-{self._n_parts:05d}.parquet")
+            # Hidden while written, so dataset readers skip it
+            tmp_path = os.path.join(parquet_dir(path), f".part-{self._n_parts:05d}.tmp")
+            pq.write_table(rows.to_arrow(fieldnames), tmp_path)
+            os.replace(tmp_path, part)
+        self._n_parts += 1
+
+    def _save_state(self):
+        """Atomically record output sizes and the number of processed files."""
+        state = {
+            "files": self._n_files,
+            "offsets": {
+                key: os.path.getsize(path) for key, (path, _) in self.tables.items()
+            },
+            "parquet": self.parquet,
+            "parts": self._n_parts,
+        }
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def done(self, path):
+        """Return True if the input file was flushed by this run or the resumed one."""
+        return os.path.basename(path) in self.processed
+
+    def add(self, filename, rows):
+        """Buffer the rows extracted from one input file (key -> ColumnarTable)."""
+        for key, table_rows in rows.items():
+            buffer = self._buffer[key]
+            if not len(buffer) and isinstance(table_rows, ColumnarTable):
+                # Encode the chunk as the extractor encodes its tables
+                buffer = self._buffer[key] = table_rows.empty_like(buffer.columns)
+            buffer.extend(table_rows)
+        self._pending.append(filename)
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Append buffered rows to the outputs and advance the checkpoint."""
+        if not self._pending:
+            return
+        for key, (path, fieldnames) in self.tables.items():
+            rows = self._buffer[key]
+            if not len(rows):
+                continue
+            if self.atomic:
+                append_csv_atomic(path, fieldnames, rows)
+            else:
+                with open(path, "a", newline="", encoding="utf-8") as f:
+                    rows.write_csv(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+        if self.parquet:
+            self._write_parts()
+
+        with open(self.processed_path, "a", encoding="utf-8") as f:
+            f.writelines(f"{name}\n" for name in self._pending)
+            f.flush()
+            os.fsync(f.fileno())
+        self._n_files += len(self._pending)
+        self.processed.update(self._pending)
+        self._save_state()
+
+        for rows in self._buffer.values():
+            rows.clear()
+        self._pending = []
+
+    def close(self):
+        """Flush the remaining rows."""
+        self.flush()
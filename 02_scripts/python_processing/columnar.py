@@ -0,0 +1,198 @@
+import csv
+from array import array
+
+# Stored in typed columns for a missing value, read back as None
+_MISSING = {"i": -1, "d": float("nan")}
+
+
+class ColumnarTable:
+    """
+    Append-only table of extracted rows, stored column by column.
+
+    Categorical columns (study ID, parameter, unit, allergen, subgroup,
+    dates, ...) are dictionary-encoded: each distinct value is stored once
+    and each row keeps a 4-byte code in a typed array. Numeric columns (the
+    page and bounding box of a row) are typed arrays too. The remaining
+    columns, such as free-text values that rarely repeat, are plain lists.
+
+    The extractors append their rows straight into per-report tables, as
+    tuples in column order, without building a dict per row. The writers
+    buffer a chunk of reports in tables encoded the same way (empty_like)
+    and write it out to CSV (write_csv) or Arrow (to_arrow).
+
+    Args:
+        columns (list): Column names.
+        categorical (iterable): Columns to dictionary-encode.
+        numeric (dict): Column -> array typecode, "i" (int) or "d" (float).
+            A missing value is stored as -1 or NaN and read back as None.
+    """
+
+    def __init__(self, columns, categorical=(), numeric=None):
+        self.columns = list(columns)
+        numeric = numeric or {}
+        self._kinds = [
+            numeric.get(name) or ("c" if name in categorical else "o")
+            for name in self.columns
+        ]
+        self.clear()
+
+    def empty_like(self, columns=None):
+        """Return an empty table of `columns` (default all), encoded as this one."""
+        kinds = dict(zip(self.columns, self._kinds))
+        columns = self.columns if columns is None else columns
+        return ColumnarTable(
+            columns,
+            [name for name in columns if kinds.get(name) == "c"],
+            {name: kinds[name] for name in columns if kinds.get(name) in _MISSING},
+        )
+
+    def clear(self):
+        """Remove all rows and forget the encoded values."""
+        self._data = []
+        self._appenders = []
+        for kind in self._kinds:
+            if kind == "c":
+                codes, values, index = array("I"), [], {}
+                self._data.append((codes, values, index))
+                self._appenders.append(self._encoder(codes, values, index))
+            elif kind in _MISSING:
+                data, missing = array(kind), _MISSING[kind]
+                self._data.append(data)
+                self._appenders.append(
+                    lambda value, data=data, missing=missing: data.append(
+                        missing if value is None else value
+                    )
+                )
+            else:
+                data = []
+                self._data.append(data)
+                self._appenders.append(data.append)
+
+    @staticmethod
+    def _encoder(codes, values, index):
+        """Return a function appending one value to a dictionary-encoded column."""
+
+        def append(value):
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(values)
+                values.append(value)
+            codes.append(code)
+
+        return append
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        data = self._data[0]
+        return len(data[0] if self._kinds[0] == "c" else data)
+
+    def append_values(self, values):
+        """Append one row given as a sequence of values in column order."""
+        for append, value in zip(self._appenders, values):
+            append(value)
+
+    def append(self, row):
+        """
+        Append one row dict. Keys outside the columns are ignored and missing
+        ones are left empty, as with csv.DictWriter(extrasaction="ignore").
+        """
+        self.append_values([row.get(name) for name in self.columns])
+
+    def extend(self, rows):
+        """Append the rows of another ColumnarTable (by column name) or row dicts."""
+        if not isinstance(rows, ColumnarTable):
+            for row in rows:
+                self.append(row)
+            return
+        n = len(rows)
+        for name, append in zip(self.columns, self._appenders):
+            for value in rows.column(name) if name in rows.columns else [None] * n:
+                append(value)
+
+    def fill(self, name, value):
+        """Set a column to the same value on every row (e.g. a report's study ID)."""
+        i = self.columns.index(name)
+        n, kind = len(self), self._kinds[i]
+        if kind == "c":
+            codes, values, index = self._data[i]
+            values[:] = [value]
+            index.clear()
+            index[value] = 0
+            codes[:] = array("I", [0]) * n
+        elif kind in _MISSING:
+            self._data[i][:] = array(kind, [_MISSING[kind] if value is None else value]) * n
+        else:
+            self._data[i][:] = [value] * n
+
+    def column(self, name):
+        """Return the decoded values of a column."""
+        i = self.columns.index(name)
+        kind, data = self._kinds[i], self._data[i]
+        if kind == "c":
+            codes, values, _ = data
+            return [values[code] for code in codes]
+        if kind == "d":
+            return [None if value != value else value for value in data]
+        if kind == "i":
+            return [None if value == -1 else value for value in data]
+        return list(data)
+
+    def take(self, indices):
+        """Return a new table with the rows at `indices`, in that order."""
+        table = self.empty_like()
+        columns = [self.column(name) for name in self.columns]
+        for i in indices:
+            table.append_values([values[i] for values in columns])
+        return table
+
+    def __iter__(self):
+        """Yield the rows as dicts, for code expecting csv.DictWriter rows."""
+        for values in zip(*(self.column(name) for name in self.columns)):
+            yield dict(zip(self.columns, values))
+
+    def write_csv(self, f, columns=None):
+        """Write the rows of `columns` (default all) to an open file, without header."""
+        columns = self.columns if columns is None else columns
+        csv.writer(f).writerows(zip(*(self.column(name) for name in columns)))
+
+    def to_arrow(self, columns=None):
+        """
+        Return the rows of `columns` (default all) as a pyarrow Table.
+
+        Categorical columns become dictionary arrays of their distinct
+        values, numeric ones int32/float64 arrays, and the others strings,
+        as written to CSV. Missing values are nulls, so chunks written
+        separately share one schema.
+        """
+        import pyarrow as pa
+
+        arrays = []
+        columns = self.columns if columns is None else columns
+        for name in columns:
+            i = self.columns.index(name)
+            kind, data = self._kinds[i], self._data[i]
+            if kind == "c":
+                codes, values, _ = data
+                missing = [value is None for value in values]
+                indices = pa.array(
+                    codes,
+                    type=pa.uint32(),
+                    mask=[missing[code] for code in codes] if any(missing) else None,
+                )
+                dictionary = pa.array(
+                    ["" if value is None else str(value) for value in values],
+                    type=pa.string(),
+                )
+                arrays.append(pa.DictionaryArray.from_arrays(indices, dictionary))
+            elif kind in _MISSING:
+                arrow_type = pa.int32() if kind == "i" else pa.float64()
+                arrays.append(pa.array(self.column(name), type=arrow_type))
+            else:
+                arrays.append(
+                    pa.array(
+                        [None if value is None else str(value) for value in data],
+                        type=pa.string(),
+                    )
+                )
+        return pa.Table.from_arrays(arrays, names=list(columns))
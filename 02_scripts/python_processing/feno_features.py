@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+import os
+import sys
+import argparse
+import warnings
+from feno_ingest import read_series
+
+# High FeNO cut-off for adults (ATS/ERS), in ppb
+DEFAULT_THRESHOLD = 50.0
+DEFAULT_WINDOWS = [7, 14]
+# Days after the first reading used for the personal baseline
+DEFAULT_BASELINE_DAYS = 14
+
+
+def parse_arguments(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Compute rolling FeNO features for exacerbation prediction."
+    )
+    parser.add_argument("store_dir", help="Root directory of the FeNO Parquet store.")
+    parser.add_argument(
+        "output_file", help="Output features file (.parquet, or .csv)."
+    )
+    parser.add_argument(
+        "--questionnaires",
+        metavar="SCORES_FILE",
+        help="CSV with questionnaire scores per id (ACQ, ACT, ...), optionally with a date column.",
+    )
+    parser.add_argument(
+        "--windows",
+        type=int,
+        nargs="+",
+        default=DEFAULT_WINDOWS,
+        help="Rolling window lengths in days (default: 7 14).",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="FeNO threshold in ppb for days-above counts (default: 50).",
+    )
+    parser.add_argument(
+        "--baseline-days",
+        type=int,
+        default=DEFAULT_BASELINE_DAYS,
+        help="Days after the first reading used as personal baseline (default: 14).",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Only compute the days after the last date in the existing output file.",
+    )
+    return parser.parse_args(argv)
+
+
+def daily_means(readings):
+    """Average the readings of each patient per calendar day."""
+    import pandas as pd
+
+    if readings.empty:
+        return pd.DataFrame(columns=["id", "date", "feno"])
+    return (
+        readings.assign(date=readings["timestamp"].dt.normalize())
+        .groupby(["id", "date"], as_index=False)["feno_ppb"]
+        .mean()
+        .rename(columns={"feno_ppb": "feno"})
+    )
+
+
+def to_grid(daily):
+    """
+    Pivot daily values into a dense (patients x days) array.
+
+    Returns:
+        tuple: (grid, ids, dates) where missing days are NaN.
+    """
+    import numpy as np
+    import pandas as pd
+
+    ids, id_index = np.unique(daily["id"].to_numpy(), return_inverse=True)
+    start = daily["date"].min()
+    day_index = ((daily["date"] - start) // pd.Timedelta(days=1)).to_numpy()
+    dates = pd.date_range(start, periods=int(day_index.max()) + 1, freq="D")
+    grid = np.full((len(ids), len(dates)), np.nan)
+    grid[id_index, day_index] = daily["feno"].to_numpy()
+    return grid, ids, dates
+
+
+def rolling_sum(values, window):
+    """Trailing rolling sum along the day axis (partial windows at the start)."""
+    import numpy as np
+
+    cumsum = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=cumsum[:, 1:])
+    days = np.arange(values.shape[1])
+    return cumsum[:, days + 1] - cumsum[:, np.maximum(days - window + 1, 0)]
+
+
+def personal_baseline(grid, baseline_days):
+    """Median FeNO over the first `baseline_days` days after each patient's first reading."""
+    import numpy as np
+
+    valid = ~np.isnan(grid)
+    first_day = np.where(valid.any(axis=1), valid.argmax(axis=1), grid.shape[1])
+    offset = np.arange(grid.shape[1])[None, :] - first_day[:, None]
+    in_period = (offset >= 0) & (offset < baseline_days)
+    with warnings.catch_warnings():
+        # All-NaN rows (no readings yet) give a NaN baseline
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmedian(np.where(in_period, grid, np.nan), axis=1)
+
+
+def rolling_features(grid, windows, threshold, baseline):
+    """
+    Compute rolling features for every patient and day at once.
+
+    For each window w: mean FeNO, least-squares slope (ppb/day), number of
+    days above the threshold and deviation of the rolling mean from the
+    personal baseline (absolute and %). A window needs at least half of its
+    days with readings (two for the slope), otherwise the feature is NaN.
+
+    Returns:
+        dict: Feature name -> (patients x days) array.
+    """
+    import numpy as np
+
+    valid = ~np.isnan(grid)
+    y = np.where(valid, grid, 0.0)
+    x = np.broadcast_to(np.arange(grid.shape[1], dtype=float), grid.shape)
+    x = np.where(valid, x, 0.0)
+    above = (valid & (y >= threshold)).astype(float)
+
+    features = {"feno": grid}
+    for w in windows:
+        n = rolling_sum(valid.astype(float), w)
+        sum_y = rolling_sum(y, w)
+        sum_x = rolling_sum(x, w)
+        sum_xx = rolling_sum(x * x, w)
+        sum_xy = rolling_sum(x * y, w)
+        enough = n >= max(2, -(-w // 2))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(enough, sum_y / n, np.nan)
+            denominator = n * sum_xx - sum_x**2
+            slope = np.where(
+                enough & (denominator > 0),
+                (n * sum_xy - sum_x * sum_y) / denominator,
+                np.nan,
+            )
+            deviation = mean - baseline[:, None]
+            deviation_pct = 100 * deviation / baseline[:, None]
+
+        features[f"feno_mean_{w}d"] = mean
+        features[f"feno_slope_{w}d"] = slope
+        features[f"feno_days_above_{w}d"] = np.where(enough, rolling_sum(above, w), np.nan)
+        features[f"feno_dev_baseline_{w}d"] = deviation
+        features[f"feno_dev_baseline_pct_{w}d"] = deviation_pct
+    features["feno_baseline"] = np.broadcast_to(baseline[:, None], grid.shape)
+    return features
+
+
+def compute_features(
+    daily,
+    windows=DEFAULT_WINDOWS,
+    threshold=DEFAULT_THRESHOLD,
+    baseline_days=DEFAULT_BASELINE_DAYS,
+    baseline=None,
+    start=None,
+):
+    """
+    Compute the feature table for all patients from daily FeNO values.
+
+    Args:
+        daily (pd.DataFrame): Columns id, date, feno.
+        baseline (pd.Series): Known baselines by id; missing ones are computed.
+        start (datetime): First date to output (earlier days are window history).
+
+    Returns:
+        pd.DataFrame: One row per patient and day, from the patient's first
+        reading to the last day with data.
+    """
+    import numpy as np
+    import pandas as pd
+
+    grid, ids, dates = to_grid(daily)
+    computed = personal_baseline(grid, baseline_days)
+    if baseline is not None:
+        known = baseline.reindex(ids).to_numpy(dtype=float)
+        computed = np.where(np.isnan(known), computed, known)
+
+    features = rolling_features(grid, windows, threshold, computed)
+
+    # Keep days from each patient's first reading onwards
+    valid = ~np.isnan(grid)
+    keep = np.cumsum(valid, axis=1) > 0
+    if start is not None:
+        keep &= (dates >= pd.Timestamp(start))[None, :]
+    rows, cols = np.nonzero(keep)
+
+    table = pd.DataFrame({"id": ids[rows], "date": dates[cols]})
+    for name, values in features.items():
+        table[name] = values[rows, cols]
+    return table
+
+
+def update_features(
+    features,
+    new_daily,
+    windows=DEFAULT_WINDOWS,
+    threshold=DEFAULT_THRESHOLD,
+    baseline_days=DEFAULT_BASELINE_DAYS,
+):
+    """
+    Extend an existing feature table with new daily values.
+
+    Only the new days are computed. The window history comes from the
+    'feno' column of the existing table. Stored baselines are reused,
+    except for patients still inside their baseline period.
+    """
+    import pandas as pd
+
+    last_date = features["date"].max()
+    history_start = last_date - pd.Timedelta(days=max(windows) - 1)
+    new_daily = new_daily[new_daily["date"] > last_date]
+    if new_daily.empty:
+        return features
+
+    history = features.loc[
+        (features["date"] >= history_start) & features["feno"].notna(),
+        ["id", "date", "feno"],
+    ]
+    baseline = features.groupby("id")["feno_baseline"].first()
+    # Patients still inside their baseline period need their full history
+    first_date = features.loc[features["feno"].notna()].groupby("id")["date"].min()
+    pending = first_date.index[
+        first_date > last_date - pd.Timedelta(days=baseline_days)
+    ].union(pd.Index(new_daily["id"].unique()).difference(first_date.index))
+    baseline = baseline.drop(pending, errors="ignore")
+    if len(pending):
+        history = pd.concat(
+            [
+                history,
+                features.loc[
+                    features["id"].isin(pending) & features["feno"].notna(),
+                    ["id", "date", "feno"],
+                ],
+            ]
+        ).drop_duplicates(["id", "date"])
+
+    tail = compute_features(
+        pd.concat([history, new_daily], ignore_index=True),
+        windows,
+        threshold,
+        baseline_days,
+        baseline=baseline.dropna(),
+        start=last_date + pd.Timedelta(days=1),
+    )
+    return pd.concat([features, tail], ignore_index=True)
+
+
+def join_questionnaires(features, scores):
+    """
+    Join questionnaire scores to the feature table.
+
+    Scores with a 'date' column are matched to the last questionnaire on or
+    before each day. Otherwise they are joined by id (baseline scores).
+    """
+    import pandas as pd
+
+    if "date" not in scores.columns:
+        return features.merge(scores, on="id", how="left")
+    scores = scores.assign(date=pd.to_datetime(scores["date"])).sort_values("date")
+    merged = pd.merge_asof(
+        features.sort_values("date"), scores, on="date", by="id", direction="backward"
+    )
+    return merged.sort_values(["id", "date"]).reset_index(drop=True)
+
+
+def read_features(file_path):
+    """Read a feature table written by this script."""
+    import pandas as pd
+
+    if file_path.endswith(".csv"):
+        return pd.read_csv(file_path, parse_dates=["date"])
+    return pd.read_parquet(file_path)
+
+
+def write_features(features, file_path):
+    """Write the feature table as CSV or Parquet, depending on the extension."""
+    tmp_path = f"{file_path}.tmp"
+    if file_path.endswith(".csv"):
+        features.to_csv(tmp_path, index=False)
+    else:
+        features.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, file_path)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    import pandas as pd
+
+    if not os.path.isdir(args.store_dir):
+        print(f"❌ Error: Store directory '{args.store_dir}' does not exist.")
+        sys.exit(1)
+
+    scores = None
+    if args.questionnaires:
+        scores = pd.read_csv(args.questionnaires)
+
+    if args.update and os.path.isfile(args.output_file):
+        features = read_features(args.output_file)
+        core_columns = [c for c in features.columns if c in ("id", "date") or c.startswith("feno")]
+        features = features[core_columns]
+        since = features["date"].max() + pd.Timedelta(days=1)
+        new_daily = daily_means(read_series(args.store_dir, start=since))
+        if new_daily.empty:
+            print("✅ Features are up to date.")
+            return
+        updated = update_features(
+            features, new_daily, args.windows, args.threshold, args.baseline_days
+        )
+        print(f"🔄 Computed {len(updated) - len(features)} new feature rows.")
+        features = updated
+    else:
+        daily = daily_means(read_series(args.store_dir))
+        if daily.empty:
+            print("❌ No FeNO readings found in the store.")
+            return
+        features = compute_features(
+            daily, args.windows, args.threshold, args.baseline_days
+        )
+        print(
+            f"✅ Computed {len(features)} feature rows for {features['id'].nunique()} patients."
+        )
+
+    if scores is not None:
+        features = join_questionnaires(features, scores)
+    write_features(features, args.output_file)
+    print(f"✅ Features saved to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import argparse
+
+# Columns of the stored FeNO series
+SERIES_COLUMNS = ["id", "timestamp", "feno_ppb", "source"]
+
+# Accepted column names in Evernoa LUX exports -> stored column
+EXPORT_COLUMNS = {
+    "patient_id": "id",
+    "subject_id": "id",
+    "id": "id",
+    "timestamp": "timestamp",
+    "datetime": "timestamp",
+    "measured_at": "timestamp",
+    "feno": "feno_ppb",
+    "feno_ppb": "feno_ppb",
+    "value": "feno_ppb",
+}
+
+INDEX_FILE = "_index.parquet"
+INDEX_COLUMNS = ["id", "month", "file", "rows", "first_timestamp", "last_timestamp"]
+
+
+def parse_arguments(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Ingest daily home FeNO device exports into a partitioned Parquet store."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="Append device exports to the store.")
+    ingest.add_argument("input_dir", help="Directory with per-patient CSV/JSON exports.")
+    ingest.add_argument("store_dir", help="Root directory of the Parquet store.")
+
+    sample = subparsers.add_parser("sample", help="Generate sample device exports.")
+    sample.add_argument("output_dir", help="Directory where the exports are written.")
+    sample.add_argument("--patients", type=int, default=5, help="Number of patients.")
+    sample.add_argument("--days", type=int, default=90, help="Days of readings.")
+    sample.add_argument("--start", default="2025-01-01", help="First day (YYYY-MM-DD).")
+    sample.add_argument("--seed", type=int, default=0, help="Random seed.")
+    return parser.parse_args(argv)
+
+
+def read_export(file_path):
+    """
+    Read one device export (CSV or JSON) into a normalized DataFrame.
+
+    JSON exports may be a list of measurements or an object with
+    "patient_id" and "measurements". When the export has no patient column,
+    the file name (without extension) is used as the study ID.
+
+    Returns:
+        pd.DataFrame: Columns id, timestamp, feno_ppb, source.
+    """
+    import pandas as pd
+
+    stem, ext = os.path.splitext(os.path.basename(file_path))
+    if ext.lower() == ".json":
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = json.load(f)
+        if isinstance(content, dict):
+            records = content.get("measurements", [])
+            df = pd.DataFrame.from_records(records)
+            if "patient_id" in content:
+                df["id"] = content["patient_id"]
+        else:
+            df = pd.DataFrame.from_records(content)
+    else:
+        df = pd.read_csv(file_path)
+
+    df = df.rename(columns=lambda c: EXPORT_COLUMNS.get(c.strip().lower(), c))
+    if "id" not in df.columns:
+        df["id"] = stem
+    missing = {"timestamp", "feno_ppb"} - set(df.columns)
+    if missing:
+        raise ValueError(f"Missing columns {sorted(missing)} in {file_path}")
+
+    df["id"] = df["id"].astype(str).str.strip()
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    df["feno_ppb"] = pd.to_numeric(df["feno_ppb"], errors="coerce")
+    df["source"] = os.path.basename(file_path)
+    return df.dropna(subset=["timestamp", "feno_ppb"])[SERIES_COLUMNS]
+
+
+def deduplicate(df):
+    """Drop repeated measurements (same patient and timestamp), keeping the last one."""
+    return (
+        df.drop_duplicates(subset=["id", "timestamp"], keep="last")
+        .sort_values(["id", "timestamp"])
+        .reset_index(drop=True)
+    )
+
+
+def partition_dir(store_dir, study_id, month):
+    """Return the directory of a patient/month partition."""
+    return os.path.join(store_dir, f"id={study_id}", f"month={month}")
+
+
+def load_index(store_dir):
+    """Load the store index (one row per part file)."""
+    import pandas as pd
+
+    index_path = os.path.join(store_dir, INDEX_FILE)
+    if not os.path.isfile(index_path):
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    return pd.read_parquet(index_path)
+
+
+def _write_parquet_atomic(df, file_path):
+    """Write a DataFrame to Parquet through a temporary file and a rename."""
+    tmp_path = f"{file_path}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, file_path)
+
+
+def append_readings(store_dir, readings):
+    """
+    Append readings to the store without rewriting existing part files.
+
+    Readings are split by patient and month. Within each partition, rows
+    whose timestamp is already stored are dropped, and the rest are written
+    as a new part file. Only the partitions touched by the new readings are
+    read, and only their timestamps.
+
+    Returns:
+        int: Number of new rows stored.
+    """
+    import pandas as pd
+
+    readings = deduplicate(readings)
+    if readings.empty:
+        return 0
+
+    index = load_index(store_dir)
+    new_entries = []
+    months = readings["timestamp"].dt.strftime("%Y-%m")
+
+    for (study_id, month), part in readings.groupby([readings["id"], months]):
+        files = index.loc[(index["id"] == study_id) & (index["month"] == month), "file"]
+        if len(files):
+            stored = pd.concat(
+                pd.read_parquet(os.path.join(store_dir, f), columns=["timestamp"])
+                for f in files
+            )["timestamp"]
+            part = part[~part["timestamp"].isin(stored)]
+        if part.empty:
+            continue
+
+        directory = partition_dir(store_dir, study_id, month)
+        os.makedirs(directory, exist_ok=True)
+        relative_path = os.path.relpath(
+            os.path.join(directory, f"part-{len(files):05d}.parquet"), store_dir
+        )
+        _write_parquet_atomic(part, os.path.join(store_dir, relative_path))
+        new_entries.append(
+            {
+                "id": study_id,
+                "month": month,
+                "file": relative_path,
+                "rows": len(part),
+                "first_timestamp": part["timestamp"].min(),
+                "last_timestamp": part["timestamp"].max(),
+            }
+        )
+
+    if new_entries:
+        index = pd.concat([index, pd.DataFrame(new_entries)], ignore_index=True)
+        index = index.sort_values(["id", "month", "file"]).reset_index(drop=True)
+        _write_parquet_atomic(index, os.path.join(store_dir, INDEX_FILE))
+    return int(sum(entry["rows"] for entry in new_entries))
+
+
+def read_series(store_dir, ids=None, start=None, end=None):
+    """
+    Read FeNO readings from the store, using the index to skip unrelated files.
+
+    Args:
+        store_dir (str): Root directory of the store.
+        ids (list): Study IDs to read (default: all).
+        start, end (str or datetime): Inclusive timestamp bounds (default: open).
+
+    Returns:
+        pd.DataFrame: Readings sorted by id and timestamp.
+    """
+    import numpy as np
+    import pandas as pd
+
+    index = load_index(store_dir)
+    selected = np.ones(len(index), dtype=bool)
+    if ids is not None:
+        selected &= index["id"].isin(ids).to_numpy()
+    if start is not None:
+        selected &= (index["last_timestamp"] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        selected &= (index["first_timestamp"] <= pd.Timestamp(end)).to_numpy()
+
+    files = index.loc[selected, "file"]
+    if files.empty:
+        return pd.DataFrame(columns=SERIES_COLUMNS)
+    df = pd.concat(
+        (pd.read_parquet(os.path.join(store_dir, f)) for f in files), ignore_index=True
+    )
+    if start is not None:
+        df = df[df["timestamp"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["timestamp"] <= pd.Timestamp(end)]
+    return df.sort_values(["id", "timestamp"]).reset_index(drop=True)
+
+
+def generate_sample(output_dir, patients=5, days=90, start="2025-01-01", seed=0):
+    """
+    Write sample Evernoa exports: one file per patient, alternating CSV and
+    JSON, with one morning reading per day, missed days and a few re-synced
+    duplicates.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    for i in range(1, patients + 1):
+        study_id = f"HCB{i:03d}"
+        dates = pd.date_range(start, periods=days, freq="D")
+        timestamps = dates + pd.to_timedelta(rng.integers(7 * 60, 10 * 60, days), unit="min")
+        baseline = rng.uniform(15, 60)
+        values = np.round(baseline + rng.normal(0, 5, days).cumsum() * 0.3, 1).clip(5)
+        df = pd.DataFrame({"timestamp": timestamps, "feno_ppb": values})
+        df = df[rng.random(days) > 0.1]  # missed days
+        df = pd.concat([df, df.sample(frac=0.05, random_state=seed + i)])  # re-synced
+
+        if i % 2:
+            df.assign(patient_id=study_id).to_csv(
+                os.path.join(output_dir, f"{study_id}.csv"), index=False
+            )
+        else:
+            content = {
+                "patient_id": study_id,
+                "measurements": [
+                    {"timestamp": ts.isoformat(), "feno_ppb": float(v)}
+                    for ts, v in zip(df["timestamp"], df["feno_ppb"])
+                ],
+            }
+            with open(os.path.join(output_dir, f"{study_id}.json"), "w", encoding="utf-8") as f:
+                json.dump(content, f)
+    print(f"✅ Sample exports for {patients} patients written to {output_dir}")
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    import pandas as pd
+
+    if args.command == "sample":
+        generate_sample(args.output_dir, args.patients, args.days, args.start, args.seed)
+        return
+
+    if not os.path.isdir(args.input_dir):
+        print(f"❌ Error: Input directory '{args.input_dir}' does not exist.")
+        sys.exit(1)
+    os.makedirs(args.store_dir, exist_ok=True)
+
+    frames, errors = [], []
+    print(f"📁 Reading FeNO exports from: {args.input_dir}")
+    for filename in sorted(os.listdir(args.input_dir)):
+        if not filename.lower().endswith((".csv", ".json")):
+            continue
+        try:
+            frames.append(read_export(os.path.join(args.input_dir, filename)))
+        except Exception as e:
+            print(f"❌ [ERROR] Failed to read {filename}: {e}")
+            errors.append(f"{filename}: {e}")
+
+    if not frames:
+        print("❌ No FeNO readings found.")
+        return
+
+    readings = pd.concat(frames, ignore_index=True)
+    stored = append_readings(args.store_dir, readings)
+    print(f"✅ Read {len(readings)} readings, stored {stored} new in {args.store_dir}")
+
+    if errors:
+        print("\n[SUMMARY] Errors occurred during processing:")
+        for err in errors:
+            print(f" - {err}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import json
+import hashlib
+from prefetch import pdf_document
+
+# Layout templates: name -> parser configuration.
+# New sites or lab-software versions are added here or in a JSON file
+# passed with --layouts (same structure, merged over these defaults).
+TEMPLATES = {
+    "hcb_blood": {
+        "kind": "blood",
+        "site": "Hospital Clínic de Barcelona",
+        "anchors": ["Data recepció mostra", "NHC:"],
+        "header_blocks": [1, 3],
+        "header_clip": [0, 0, 595, 282],
+        "vertical_line": [[377, 282], [377, 758]],
+        "date_format": "%d/%m/%Y",
+        "labels": {
+            "nhc": "NHC:",
+            "sample_reception_date": "Data recepció mostra",
+            "birth_date": "Data naix.",
+        },
+        "sections": {
+            "haemogram": "HEMOGRAMA",
+            "manual_differential": "REVISIÓ LEUCOCITÀRIA MANUAL",
+            "automatic_differential": "RECOMPTE DIFERENCIAL AUTOMÀTIC",
+            "specific_allergens": "AL·LÈRGENS ESPECÍFICS",
+            "recombinant_allergens": "AL·LÈRGENS RECOMBINANTS",
+            "allergy_subgroup": "AL·LÈRGIA ",
+            "ige_total": "IGE total",
+            "table_header": ["Prestació", "Resultat", "Unitat"],
+            "end_haemogram": [
+                "AL·LÈRGENS ESPECÍFICS",
+                "HEMOSTÀSIA GENERAL",
+                "IMMUNOQUÍMICA",
+            ],
+        },
+    },
+    "hcb_spirometry": {
+        "kind": "spirometry",
+        "site": "Hospital Clínic de Barcelona",
+        "anchors": ["ESPIROMETRIA FORÇADA"],
+        "date_format": "%d/%m/%Y",
+        "labels": {
+            "nhc": "NHC :",
+            "age": "Edat",
+            "date": r"Data exploraci[oó]\s*:?\s*([0-9]{2}/[0-9]{2}/[0-9]{4})",
+        },
+        "header_pattern": r"Pre\s+Teòric|Pre\s+Teòric\s+LIN",
+        "history_row_pattern": r"^([0-9]{2}/[0-9]{2}/[0-9]{4})\s+",
+        "sections": {
+            "spirometry": "ESPIROMETRIA FORÇADA",
+            "history": "HISTÒRIC",
+            "history_header": "Data",
+            "lung_volumes": "VOLUMS PULMONARS",
+            "diffusion": "DIFUSIÓ",
+            "end_spirometry": ["HISTÒRIC", "VOLUMS PULMONARS", "DIFUSIÓ"],
+        },
+    },
+}
+
+# Template used for a report of each kind that matches no template's anchors
+DEFAULT_TEMPLATES = {"blood": "hcb_blood", "spirometry": "hcb_spirometry"}
+
+# Fingerprint -> template name, learned during the run
+_fingerprints = {}
+
+# Fraction of the first page used for the fingerprint (header area)
+FINGERPRINT_REGION = 0.3
+
+
+def add_layout_arguments(parser):
+    """Add the shared --layouts option to an extractor's argument parser."""
+    parser.add_argument(
+        "--layouts",
+        metavar="LAYOUTS_FILE",
+        help="JSON file with additional report layout templates (e.g. other study sites).",
+    )
+
+
+def load_templates(file_path):
+    """Load layout templates from a JSON file and register them."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        templates = json.load(f)
+    TEMPLATES.update(templates)
+    _fingerprints.clear()
+    return templates
+
+
+def get_template(name):
+    """Return a registered template by name, including its name."""
+    return dict(TEMPLATES[name], name=name)
+
+
+def fingerprint(page):
+    """
+    Compute a cheap fingerprint of a report layout from its first page.
+
+    Only the header region is read. The fingerprint combines the page size
+    with the text and rounded vertical position of the labels (words ending
+    in ':'), which stay fixed for a layout while patient values change.
+    """
+    import fitz  # PyMuPDF
+
+    rect = page.rect
+    clip = fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + rect.height * FINGERPRINT_REGION)
+    words = page.get_text("words", clip=clip)
+    labels = sorted({(w[4], round(w[1] / 10)) for w in words if w[4].endswith(":")})
+    key = f"{round(rect.width)}x{round(rect.height)}|" + "|".join(
+        f"{text}@{y}" for text, y in labels
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _matches(text, template):
+    """Return True if every anchor of the template appears in the page text."""
+    return all(anchor in text for anchor in template.get("anchors", []))
+
+
+def identify_layout(pdf_path, kind, doc=None):
+    """
+    Return the layout template of a report.
+
+    Known fingerprints go straight to their template. Unknown ones are
+    matched against the anchors of each template of the requested kind, and
+    the result is remembered so later reports with the same layout skip it.
+    A report matching no template is parsed with the default template of
+    its kind (DEFAULT_TEMPLATES), with a warning, so its tables are still
+    extracted as before templates existed.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        kind (str): Report kind ("blood" or "spirometry").
+        doc (fitz.Document, optional): The report, if already open.
+
+    Returns:
+        dict: The matching template, with its "name".
+    """
+    with pdf_document(pdf_path, doc) as doc:
+        page = doc[0]
+        key = fingerprint(page)
+        name = _fingerprints.get(key)
+        if name is not None and TEMPLATES[name]["kind"] == kind:
+            return get_template(name)
+
+        text = page.get_text("text")
+        for name, template in TEMPLATES.items():
+            if template["kind"] == kind and _matches(text, template):
+                _fingerprints[key] = name
+                return get_template(name)
+
+    name = DEFAULT_TEMPLATES[kind]
+    print(f"⚠️ No {kind} layout template matches {pdf_path}; using '{name}'")
+    return get_template(name)
@@ -0,0 +1,134 @@
+import os
+import csv
+from utils import detect_encoding
+
+# Hidden, so the R pipeline (which reads every file of the output
+# directory as a form) does not pick it up
+CATALOG_FILE = ".subject_catalog.csv"
+CATALOG_COLUMNS = ["filename", "subject", "visit", "form", "size", "mtime"]
+
+# Lines read from the top of an export to find its "Site:" line
+HEADER_LINES = 10
+
+
+def parse_site_line(question):
+    """
+    Parse the "Site: X / Subject: Y / Visit: Z / Form: F" line of an export.
+
+    Returns:
+        tuple: (subject, visit, form)
+    """
+    parts = question.split("/")
+    subject = parts[1].split(":")[1].strip()
+    visit = parts[2].split(":")[1].strip()
+    form = parts[3].split(":")[1].strip()
+    return subject, visit, form
+
+
+def read_export_header(input_path, max_lines=HEADER_LINES):
+    """
+    Read only the first lines of a SubjectData export to find its subject,
+    visit and form.
+
+    Returns:
+        tuple: (subject, visit, form), or None if no "Site:" line was found.
+    """
+    encoding = detect_encoding(input_path)
+    if not encoding:
+        return None
+    with open(input_path, encoding=encoding, newline="") as f:
+        head = [line for _, line in zip(range(max_lines), f)]
+    for row in csv.reader(head):
+        if row and row[0].strip().startswith("Site:"):
+            return parse_site_line(row[0].strip())
+    return None
+
+
+def load_catalog(catalog_path):
+    """Load the catalog as filename -> entry dict (empty if missing)."""
+    if not os.path.isfile(catalog_path):
+        return {}
+    with open(catalog_path, "r", newline="", encoding="utf-8") as f:
+        return {row["filename"]: row for row in csv.DictReader(f)}
+
+
+def save_catalog(catalog_path, catalog):
+    """Write the catalog, replacing the previous one in a single rename."""
+    tmp_path = f"{catalog_path}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CATALOG_COLUMNS)
+        writer.writeheader()
+        writer.writerows(catalog[name] for name in sorted(catalog))
+    os.replace(tmp_path, catalog_path)
+
+
+def update_catalog(input_dir, catalog_path, is_export):
+    """
+    Bring the catalog of the exports in a directory up to date.
+
+    Only exports that are new or whose size or modification time changed
+    have their header read; the rest is taken from the saved catalog.
+    Exports that disappeared are dropped.
+
+    Args:
+        input_dir (str): Directory with the exports.
+        catalog_path (str): Catalog CSV file.
+        is_export (callable): Filter on file names.
+
+    Returns:
+        dict: filename -> entry (subject, visit, form, size, mtime).
+    """
+    previous = load_catalog(catalog_path)
+    catalog, n_read = {}, 0
+    for entry in os.scandir(input_dir):
+        if not is_export(entry.name):
+            continue
+        stat = entry.stat()
+        size, mtime = str(stat.st_size), str(int(stat.st_mtime))
+        known = previous.get(entry.name)
+        if known and known["size"] == size and known["mtime"] == mtime:
+            catalog[entry.name] = known
+            continue
+
+        try:
+            header = read_export_header(entry.path)
+        except Exception as e:
+            print(f"  ⚠️ Could not read header of {entry.name}: {e}")
+            header = None
+        subject, visit, form = header or ("", "", "")
+        catalog[entry.name] = {
+            "filename": entry.name,
+            "subject": subject,
+            "visit": visit,
+            "form": form,
+            "size": size,
+            "mtime": mtime,
+        }
+        n_read += 1
+
+    if n_read or len(catalog) != len(previous):
+        save_catalog(catalog_path, catalog)
+    print(f"🗂️  Catalog: {len(catalog)} exports ({n_read} headers read)")
+    return catalog
+
+
+def normalize_form(form):
+    """Normalize a form name as in the output file names (lowercase, underscores)."""
+    return form.lower().replace(" ", "_")
+
+
+def select_exports(catalog, forms=None, subjects=None):
+    """
+    Return the file names of the catalog matching the given forms and subjects.
+
+    Forms match case-insensitively, also in normalized form ("acq", "ACQ").
+    Exports without a detected form are kept when no filter applies.
+    """
+    forms = {normalize_form(form) for form in forms} if forms else None
+    subjects = {subject.upper() for subject in subjects} if subjects else None
+    return sorted(
+        name
+        for name, entry in catalog.items()
+        if (forms is None or normalize_form(entry["form"]) in forms)
+        and (subjects is None or entry["subject"].upper() in subjects)
+    )
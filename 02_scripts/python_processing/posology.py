@@ -0,0 +1,203 @@
+import re
+import unicodedata
+from functools import lru_cache
+from collections import namedtuple
+
+# Structured fields of a posology string, in output column order
+Posology = namedtuple(
+    "Posology", ["dose", "dose_unit", "freq_per_day", "route", "as_needed"]
+)
+POSOLOGY_COLUMNS = list(Posology._fields)
+
+# Unit spellings -> unit
+UNITS = {
+    "INH": "INH",
+    "INHAL": "INH",
+    "INHALACIO": "INH",
+    "INHALACIONS": "INH",
+    "INHALACION": "INH",
+    "INHALACIONES": "INH",
+    "PULS": "PULS",
+    "PULSACIO": "PULS",
+    "PULSACIONS": "PULS",
+    "PULSACION": "PULS",
+    "PULSACIONES": "PULS",
+    "MG": "MG",
+    "MCG": "MCG",
+    "G": "G",
+    "ML": "ML",
+    "UI": "UI",
+    "COMP": "COMP",
+    "COMPRIMIT": "COMP",
+    "COMPRIMITS": "COMP",
+    "COMPRIMIDO": "COMP",
+    "COMPRIMIDOS": "COMP",
+    "CAPS": "CAPS",
+    "CAPSULA": "CAPS",
+    "CAPSULES": "CAPS",
+    "CAPSULAS": "CAPS",
+    "GOTES": "GOTES",
+    "GOTAS": "GOTES",
+    "AMP": "AMP",
+    "SOBRE": "SOBRE",
+    "SOBRES": "SOBRE",
+    "APLICACIO": "APLIC",
+    "APLICACION": "APLIC",
+    "%": "%",
+}
+
+# Route spellings -> route (same names as 05_process_treatment_data.R)
+ROUTES = {
+    "PULMONAR": "PULMONAR",
+    "INHALADA": "PULMONAR",
+    "INHALATORIA": "PULMONAR",
+    "ORAL": "ORAL",
+    "VO": "ORAL",
+    "SUBCUTANEA": "SUBCUTANEA",
+    "SUBCUTANIA": "SUBCUTANEA",
+    "SC": "SUBCUTANEA",
+    "NASAL": "NASAL",
+    "INTRANASAL": "NASAL",
+    "TOPICA": "TOPICA",
+    "CUTANEA": "TOPICA",
+    "OFTALMICA": "OFTALMICA",
+    "INTRAVENOSA": "INTRAVENOSA",
+    "IV": "INTRAVENOSA",
+    "INTRAMUSCULAR": "INTRAMUSCULAR",
+    "IM": "INTRAMUSCULAR",
+}
+
+AS_NEEDED = [
+    "SI PRECISA",
+    "SI CAL",
+    "S/P",
+    "A DEMANDA",
+    "PRN",
+    "SEGONS NECESSITAT",
+    "SEGUN NECESIDAD",
+    "RESCAT",
+    "RESCATE",
+]
+
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_DOSE = re.compile(r"^(\d+/\d+|\d+(?:[.,]\d+)?)\s*([A-Z%]+)?")
+# Leading numbers that are not a dose: clock times ("08:00 20:00"),
+# treatment durations ("365 DIES") and counts of takes ("1 VEZ AL DIA")
+_NOT_DOSE = re.compile(
+    rf"^(?:\d{{1,2}}:\d{{2}}|{_NUMBER}\s*(?:DIES|DIAS|VEZ|VECES|VEGADA|VEGADES)\b)"
+)
+# Meal schedules: "1-0-1", "DE-0-CE", "0-CO-0-N"
+_SCHEDULE = re.compile(r"\b((?:[0-9.,]+|DE|CO|CE|N)(?:-(?:[0-9.,]+|DE|CO|CE|N)){2,3})\b")
+_TIMES = re.compile(r"\b\d{1,2}:\d{2}\b")
+# (pattern, doses per day as a function of the captured count)
+_FREQUENCIES = [
+    (re.compile(rf"(?:C/|CADA\s*|/)\s*{_NUMBER}?\s*H(?:ORES|ORAS)?\b"), lambda n: 24 / n),
+    (re.compile(rf"\b{_NUMBER}\s*HORES\b"), lambda n: 24 / n),
+    (re.compile(rf"(?:C/|CADA\s*){_NUMBER}?\s*(?:DIES|DIAS|DIA|D)\b"), lambda n: 1 / n),
+    (
+        re.compile(rf"(?:C/|CADA\s*){_NUMBER}?\s*(?:SEMANAS?|SETMANES|SETMANA)\b"),
+        lambda n: 1 / (7 * n),
+    ),
+    (
+        re.compile(rf"(?:C/|CADA\s*){_NUMBER}?\s*(?:MESOS|MESES|MES)\b"),
+        lambda n: 1 / (30 * n),
+    ),
+    (re.compile(rf"\b{_NUMBER}\s*(?:VEGADES|VECES)\s*(?:AL|A)\s*DIA\b"), lambda n: n),
+    (re.compile(r"\b(?:AL|A|PER)\s+DIA\b"), lambda n: 1.0),
+    # A treatment duration alone ("365 DIES") means daily, as in the R harmonization
+    (re.compile(rf"^{_NUMBER}\s*(?:DIES|DIAS)\b"), lambda n: 1.0),
+]
+
+
+def to_number(text):
+    """Convert "2,5", "2.5" or "1/2" to float; None if empty or a fraction over 0."""
+    if not text:
+        return None
+    if "/" in text:
+        numerator, denominator = (float(part) for part in text.split("/"))
+        return numerator / denominator if denominator else None
+    return float(text.replace(",", "."))
+
+
+def normalize_posology(text):
+    """Uppercase, strip accents and collapse spaces (also around '/')."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).upper()
+    text = re.sub(r"\s*/\s*", " / ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    # Keep "C/12H"-style frequencies, "S/P" and fractions ("1/2") together
+    text = re.sub(r"\b(C|S) / ", r"\1/", text)
+    return re.sub(r"\b(\d+) / (\d+)\b(?!\s*H)", r"\1/\2", text)
+
+
+def _frequency(text):
+    """Return the number of doses per day of a normalized posology, or None."""
+    for pattern, per_day in _FREQUENCIES:
+        match = pattern.search(text)
+        if match:
+            count = to_number(match.group(1)) if pattern.groups else None
+            if count == 0:
+                return None  # "C/0H": no usable interval
+            return round(per_day(1 if count is None else count), 4)
+
+    schedule = _SCHEDULE.search(text)
+    if schedule:
+        return float(sum(part not in ("0", "") for part in schedule.group(1).split("-")))
+
+    times = _TIMES.findall(text)
+    if times:
+        return float(len(times))
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _parse_normalized(text):
+    """Parse a normalized posology string (cached: strings repeat a lot)."""
+    dose, unit = None, None
+    match = _DOSE.match(text)
+    schedule = _SCHEDULE.search(text)
+    if schedule and schedule.start() == 0:
+        # "1-0-1": the dose is the first non-zero take
+        takes = [
+            to_number(part)
+            for part in schedule.group(1).split("-")
+            if re.fullmatch(r"[0-9.,]+", part)
+        ]
+        dose = next((take for take in takes if take), None)
+    elif match and not _NOT_DOSE.match(text):
+        dose = to_number(match.group(1))
+        unit = UNITS.get(match.group(2))
+
+    words = re.findall(r"[A-Z]+", text)
+    route = next((ROUTES[word] for word in words if word in ROUTES), None)
+    as_needed = any(
+        re.search(rf"(?<![A-Z]){re.escape(pattern)}(?![A-Z])", text)
+        for pattern in AS_NEEDED
+    )
+
+    return Posology(dose, unit, _frequency(text), route, as_needed)
+
+
+def parse_posology(text):
+    """
+    Parse a posology string into structured fields.
+
+    Handles the hospital format "2 INH / C/12H / PULMONAR (SEGONS EVOLUCIO)"
+    as well as free text like "1-0-1", "cada 12 h" or "2 inh/12h". Results
+    are cached by normalized string, see posology_cache_info().
+
+    Args:
+        text (str): Raw posology.
+
+    Returns:
+        Posology: (dose, dose_unit, freq_per_day, route, as_needed); fields
+        that cannot be read are None.
+    """
+    return _parse_normalized(normalize_posology(text))
+
+
+def posology_cache_info():
+    """Return (hits, misses, hit ratio) of the posology parsing cache."""
+    info = _parse_normalized.cache_info()
+    total = info.hits + info.misses
+    return info.hits, info.misses, info.hits / total if total else 0.0
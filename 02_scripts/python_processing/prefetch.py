@@ -0,0 +1,106 @@
+import io
+import itertools
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def add_prefetch_arguments(parser):
+    """Add the shared --prefetch option to an extractor's argument parser."""
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=8,
+        metavar="N",
+        help="Number of input files read ahead on background threads (default: 8, 0 to disable).",
+    )
+
+
+class PrefetchedFile(str):
+    """
+    A file path carrying the file's bytes, read ahead by prefetch().
+
+    It behaves as the path everywhere (messages, os.path), while open_pdf,
+    open_text, detect_encoding and file_sha256 use the bytes already in
+    memory. `data` is None when the read failed: the file is then opened
+    from its path, so the error is reported where the file is parsed.
+    """
+
+    def __new__(cls, path, data=None):
+        prefetched = super().__new__(cls, path)
+        prefetched.data = data
+        return prefetched
+
+
+def _read(path):
+    """Read a whole file into a PrefetchedFile."""
+    try:
+        with open(path, "rb") as f:
+            return PrefetchedFile(path, f.read())
+    except OSError:
+        return PrefetchedFile(path)
+
+
+def prefetch(paths, depth=8):
+    """
+    Yield the files of `paths` in order, read ahead on background threads.
+
+    While the caller parses one file, up to `depth` following files are
+    being read (or waiting in memory), so slow storage latency overlaps
+    with parsing instead of adding to it. With depth 0 the paths are
+    yielded as they are and read by the parser itself.
+
+    Args:
+        paths (iterable): Paths of the files to read.
+        depth (int): Maximum number of files read ahead.
+
+    Yields:
+        PrefetchedFile: The path, with the file's bytes in `data`.
+    """
+    if depth <= 0:
+        yield from paths
+        return
+
+    paths = iter(paths)
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        pending = deque(executor.submit(_read, path) for path in itertools.islice(paths, depth))
+        while pending:
+            future = pending.popleft()
+            for path in itertools.islice(paths, 1):
+                pending.append(executor.submit(_read, path))
+            yield future.result()
+
+
+def open_pdf(source):
+    """Open a PDF from a path, or from memory for a PrefetchedFile."""
+    import fitz  # PyMuPDF
+
+    data = getattr(source, "data", None)
+    if data is not None:
+        return fitz.open(stream=data, filetype="pdf")
+    return fitz.open(source)
+
+
+@contextmanager
+def pdf_document(source, doc=None):
+    """
+    Yield `doc` when the caller already opened the PDF, else open it from
+    `source` with open_pdf() and close it on exit. Lets a report be opened
+    once and handed to every extractor that reads it.
+    """
+    if doc is not None:
+        yield doc
+        return
+    doc = open_pdf(source)
+    try:
+        yield doc
+    finally:
+        doc.close()
+
+
+def open_text(source, encoding):
+    """Open a text file for csv reading, from memory for a PrefetchedFile."""
+    data = getattr(source, "data", None)
+    if data is not None:
+        return io.StringIO(data.decode(encoding), newline="")
+    return open(source, encoding=encoding, newline="")
@@ -1,14 +1,109 @@
 #!/usr/bin/env python3
 import os
-import csv
 import traceback
 import argparse
-import fitz  # PyMuPDF
 from datetime import datetime
 from utils import load_nhc_mapping
-
-
-def parse_arguments():
+from checkpoint import add_checkpoint_arguments, parquet_dir, CheckpointedWriter
+from watch import add_watch_arguments, watch_directory
+from layouts import add_layout_arguments, load_templates, identify_layout, get_template
+from prefetch import add_prefetch_arguments, prefetch, pdf_document
+from shard import add_shard_arguments, in_shard, shard_output_dir
+from upsert import add_upsert_arguments, oldest_first, KeyedWriter
+from columnar import ColumnarTable
+from provenance import (
+    add_provenance_arguments,
+    file_sha256,
+    location,
+    ProvenanceIndex,
+    replace_rows,
+    LOCATION_COLUMNS,
+    LOCATION_TYPES,
+)
+
+# Recorded with every extracted row in the provenance index; bump it when a
+# parser change alters the output, so affected rows can be re-extracted.
+EXTRACTOR_VERSION = "1.2"
+
+# Output tables: key -> (subdirectory, file name, columns)
+OUTPUT_TABLES = {
+    "metadata": (
+        "",
+        "metadata_auto.csv",
+        ["id", "name", "sample_reception_date", "birth_date"],
+    ),
+    "haemogram": (
+        "hematology",
+        "hemograma_auto.csv",
+        ["id", "parameter", "value", "unit", "sample_reception_date"],
+    ),
+    "leucocytes": (
+        "hematology",
+        "leucocitos_auto.csv",
+        ["id", "parameter", "value", "unit", "sample_reception_date"],
+    ),
+    "ige_total": (
+        "immunology",
+        "ige_total_auto.csv",
+        ["id", "value", "sample_reception_date"],
+    ),
+    "ige_specific": (
+        "immunology",
+        "ige_specific_auto.csv",
+        [
+            "id",
+            "subgroup",
+            "allergen",
+            "value",
+            "unit",
+            "ref_interval",
+            "sample_reception_date",
+        ],
+    ),
+    "ige_recombinant": (
+        "immunology",
+        "ige_recombinant_auto.csv",
+        ["id", "allergen", "value", "unit", "ref_interval", "sample_reception_date"],
+    ),
+}
+
+# Columns identifying a record of each table, for --upsert. A corrected or
+# re-issued report replaces the values of the same patient and sample date.
+# Leucocytes are given both in x10^9/L and in %, hence the unit.
+TABLE_KEYS = {
+    "metadata": ["id", "sample_reception_date"],
+    "haemogram": ["id", "sample_reception_date", "parameter", "unit"],
+    "leucocytes": ["id", "sample_reception_date", "parameter", "unit"],
+    "ige_total": ["id", "sample_reception_date"],
+    "ige_specific": ["id", "sample_reception_date", "subgroup", "allergen"],
+    "ige_recombinant": ["id", "sample_reception_date", "allergen"],
+}
+
+# Columns with few distinct values, dictionary-encoded in memory (see ColumnarTable)
+CATEGORICAL_COLUMNS = {
+    "id",
+    "name",
+    "sample_reception_date",
+    "birth_date",
+    "parameter",
+    "unit",
+    "subgroup",
+    "allergen",
+    "ref_interval",
+}
+
+# Extractor needed for each output table (the header is always read for the ID)
+SECTION_EXTRACTORS = {
+    "metadata": "header",
+    "haemogram": "haemogram",
+    "leucocytes": "haemogram",
+    "ige_total": "ige",
+    "ige_specific": "ige",
+    "ige_recombinant": "ige",
+}
+
+
+def parse_arguments(argv=None):
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(
         description="Extract data from blood analysis PDFs and save to structured CSV files."
@@ -20,67 +115,138 @@ def parse_arguments():
     parser.add_argument(
         "mapping_file", help="Path to the NHC to study ID mapping CSV file."
     )
-    return parser.parse_args()
+    add_watch_arguments(parser)
+    add_layout_arguments(parser)
+    add_checkpoint_arguments(parser)
+    add_provenance_arguments(parser)
+    add_prefetch_arguments(parser)
+    add_shard_arguments(parser)
+    add_upsert_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def header_blocks(page, layout):
+    """
+    Return the two header blocks (name and NHC, dates) of a report page.
+
+    Only the layout's header rectangle is read. If either block is not
+    found there (no anchor label), the whole page is parsed and the blocks
+    are taken by their position, as configured in "header_blocks".
+    """
+    import fitz  # PyMuPDF
+
+    labels = layout["labels"]
+    if layout.get("header_clip"):
+        blocks = page.get_text("blocks", clip=fitz.Rect(layout["header_clip"]))
+        name_block = next((b for b in blocks if labels["nhc"] in b[4]), None)
+        date_block = next(
+            (b for b in blocks if labels["sample_reception_date"] in b[4]), None
+        )
+        if name_block and date_block:
+            return [name_block, date_block]
+
+    first, last = layout["header_blocks"]
+    return page.get_text("blocks", sort=True)[first:last]
 
 
-def extract_header_info(pdf_path):
-    doc = fitz.open(pdf_path)
-    page = doc[0]
-    blocks = page.get_text("blocks", sort=True)[1:3]
+def extract_header_info(pdf_path, layout=None, doc=None):
+    layout = layout or get_template("hcb_blood")
+    labels = layout["labels"]
+    with pdf_document(pdf_path, doc) as doc:
+        blocks = header_blocks(doc[0], layout)
 
     header_info = {
         "nhc": "NA",
         "name": "NA",
         "sample_reception_date": "NA",
         "birth_date": "NA",
+        "page": 0,
+        "bbox": tuple(blocks[0][:4]),
     }
 
     # Block 1: name and NHC
     lines1 = blocks[0][4].splitlines()
     # header_info["name"] = lines1[0].strip()
     header_info["nhc"] = (
-        lines1[1].strip().replace("NHC: ", "") if "NHC:" in lines1[1] else "NA"
+        lines1[1].split(labels["nhc"], 1)[1].strip()
+        if labels["nhc"] in lines1[1]
+        else "NA"
     )
 
     # Block 2: dates
     for line in blocks[1][4].splitlines():
-        if "Data recepció mostra" in line:
-            date = line.split(",")[0].replace(" Data recepció mostra: ", "").strip()
+        if labels["sample_reception_date"] in line:
+            date = (
+                line.split(",")[0]
+                .split(labels["sample_reception_date"], 1)[1]
+                .lstrip(":")
+                .strip()
+            )
             header_info["sample_reception_date"] = datetime.strptime(
-                date, "%d/%m/%Y"
+                date, layout["date_format"]
             ).strftime("%Y-%m-%d")
-        elif "Data naix." in line:
+        elif labels["birth_date"] in line:
             date = line.split(":")[1].strip()
-            header_info["birth_date"] = datetime.strptime(date, "%d/%m/%Y").strftime(
-                "%Y-%m-%d"
-            )
+            header_info["birth_date"] = datetime.strptime(
+                date, layout["date_format"]
+            ).strftime("%Y-%m-%d")
 
-    doc.close()
     return header_info
 
 
-def write_csv(file_path, fieldnames, data_rows):
-    """Write data to a CSV file."""
-    with open(file_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(data_rows)
+def new_tables():
+    """
+    Return empty tables for the rows of one report, keyed as in OUTPUT_TABLES.
 
+    Each table has the output columns, then the location of the row
+    (LOCATION_COLUMNS) for the provenance index.
+    """
+    return {
+        key: ColumnarTable(
+            fieldnames + LOCATION_COLUMNS, CATEGORICAL_COLUMNS, LOCATION_TYPES
+        )
+        for key, (_, _, fieldnames) in OUTPUT_TABLES.items()
+    }
 
-def extract_haemogram_values(pdf_path):
-    doc = fitz.open(pdf_path)
 
-    haemogram_results = []
-    manual_results = []
-    automatic_results = []
+def extract_haemogram_values(pdf_path, tables, study_id, date, layout=None, doc=None):
+    """
+    Append the haemogram and leucocyte rows of a report to `tables`
+    ("haemogram" and "leucocytes", see new_tables()).
+
+    The manual differential replaces the automatic one when the report
+    has both.
+    """
+    layout = layout or get_template("hcb_blood")
+    sections = layout["sections"]
+    haemogram, leucocytes = tables["haemogram"], tables["leucocytes"]
+    manual, automatic = 0, []
+    with pdf_document(pdf_path, doc) as doc:
+        for section, parameter, value, unit, page, bbox in _haemogram_rows(doc, layout):
+            row = (study_id, parameter, value, unit, date, *location(page, bbox))
+            if section == sections["haemogram"]:
+                haemogram.append_values(row)
+            elif section == sections["manual_differential"]:
+                leucocytes.append_values(row)
+                manual += 1
+            elif section == sections["automatic_differential"]:
+                automatic.append(row)
+    if not manual:
+        for row in automatic:
+            leucocytes.append_values(row)
+
+
+def _haemogram_rows(doc, layout):
+    """Yield (section, parameter, value, unit, page, bbox) of each haemogram row."""
+    sections = layout["sections"]
 
     # Add vertical line to help split columns
-    vertical_line = ((377, 282), (377, 758))
+    vertical_line = tuple(tuple(point) for point in layout["vertical_line"])
     current_section = None
 
     for page in doc:
         for table in page.find_tables(add_lines=[vertical_line]).tables:
-            for row in table.extract():
+            for row, cells in zip(table.extract(), table.rows):
                 if not row or len(row) < 3:
                     continue
 
@@ -88,110 +254,194 @@ def extract_haemogram_values(pdf_path):
 
                 # Detect new sections based on uppercase text
                 if parameter.isupper():
-                    if parameter in [
-                        "AL·LÈRGENS ESPECÍFICS",
-                        "HEMOSTÀSIA GENERAL",
-                        "IMMUNOQUÍMICA",
-                    ]:
-                        doc.close()
-                        return haemogram_results, (
-                            manual_results if manual_results else automatic_results
-                        )
+                    if parameter in sections["end_haemogram"]:
+                        return
                     current_section = parameter
                     continue
 
                 # Skip lines containing 'Prestació,Resultat,Unitat'
-                if (
-                    parameter == "Prestació"
-                    and value == "Resultat"
-                    and unit == "Unitat"
-                ):
+                if [parameter, value, unit] == sections["table_header"]:
                     continue
 
                 # Skip invalid rows
                 if not parameter or not value or not unit:
                     continue
 
-                # Store data in the appropriate section
-                entry = {"parameter": parameter, "value": value, "unit": unit}
-                if current_section == "HEMOGRAMA":
-                    haemogram_results.append(entry)
-                elif current_section == "REVISIÓ LEUCOCITÀRIA MANUAL":
-                    manual_results.append(entry)
-                elif current_section == "RECOMPTE DIFERENCIAL AUTOMÀTIC":
-                    automatic_results.append(entry)
+                yield current_section, parameter, value, unit, page.number, cells.bbox
 
-    doc.close()
-    return haemogram_results, manual_results if manual_results else automatic_results
 
+def extract_ige_values(pdf_path, tables, study_id, date, layout=None, doc=None):
+    """
+    Append the IgE rows of a report to `tables` ("ige_total", "ige_specific"
+    and "ige_recombinant", see new_tables()).
+    """
+    import fitz  # PyMuPDF
 
-def extract_ige_values(pdf_path):
-    doc = fitz.open(pdf_path)
-    ige_total = "NA"
-    specifics, recombinants = {}, []
+    layout = layout or get_template("hcb_blood")
+    sections = layout["sections"]
+    specific_section = sections["specific_allergens"]
+    recombinant_section = sections["recombinant_allergens"]
+    ige_total = None
     current_section, current_subgroup = None, None
-    vertical_line = ((377, 282), (377, 758))
-    for page in doc:
-        styled_blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]
-        for table in page.find_tables(add_lines=[vertical_line]):
-            for row in table.extract():
-                allergen, value, unit = row[0].strip(), row[1].strip(), row[2].strip()
-                ref_interval = row[3].strip() if len(row) > 3 else "NA"
-
-                if allergen == "AL·LÈRGENS ESPECÍFICS":
-                    current_section = "AL·LÈRGENS ESPECÍFICS"
-                    continue
-                elif allergen == "AL·LÈRGENS RECOMBINANTS":
-                    current_section = "AL·LÈRGENS RECOMBINANTS"
-                    continue
-                if current_section == "AL·LÈRGENS ESPECÍFICS" and allergen.startswith(
-                    "AL·LÈRGIA"
-                ):
-                    current_subgroup = allergen.replace("AL·LÈRGIA ", "")
-                    continue
+    vertical_line = tuple(tuple(point) for point in layout["vertical_line"])
+    with pdf_document(pdf_path, doc) as doc:
+        for page in doc:
+            styled_blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]
+            for table in page.find_tables(add_lines=[vertical_line]):
+                for row, cells in zip(table.extract(), table.rows):
+                    allergen, value, unit = row[0].strip(), row[1].strip(), row[2].strip()
+                    ref_interval = row[3].strip() if len(row) > 3 else "NA"
+
+                    if allergen == specific_section:
+                        current_section = specific_section
+                        continue
+                    elif allergen == recombinant_section:
+                        current_section = recombinant_section
+                        continue
+                    if current_section == specific_section and allergen.startswith(
+                        sections["allergy_subgroup"].strip()
+                    ):
+                        current_subgroup = allergen.replace(sections["allergy_subgroup"], "")
+                        continue
+
+                    # Save IgE Total (the last one found)
+                    if sections["ige_total"] in allergen:
+                        where = location(page.number, cells.bbox)
+                        ige_total = (study_id, value, date, *where)
+                        continue
+
+                    # Skip if does not contains IgE
+                    if "IgE" not in allergen:
+                        continue
+
+                    # Skip if there's no unit (to filter non-result lines)
+                    if not unit:
+                        continue
+
+                    # Check bold
+                    bold = any(
+                        value in span.get("text", "") and "Bold" in span.get("font", "")
+                        for block in styled_blocks
+                        for line in block.get("lines", [])
+                        for span in line.get("spans", [])
+                    )
+
+                    # Skip if not bold
+                    if not bold:
+                        continue
+
+                    where = location(page.number, cells.bbox)
+                    if current_section == specific_section and current_subgroup:
+                        tables["ige_specific"].append_values(
+                            (
+                                study_id,
+                                current_subgroup,
+                                allergen,
+                                value,
+                                unit,
+                                ref_interval,
+                                date,
+                                *where,
+                            )
+                        )
+                    elif current_section == recombinant_section:
+                        tables["ige_recombinant"].append_values(
+                            (study_id, allergen, value, unit, ref_interval, date, *where)
+                        )
+    if ige_total is not None:
+        tables["ige_total"].append_values(ige_total)
+
+
+def process_pdf(pdf_path, nhc_to_id, sections=None):
+    """
+    Extract the tables of one blood analysis PDF, keyed as in OUTPUT_TABLES.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        nhc_to_id (dict): NHC to study ID mapping.
+        sections (iterable, optional): Only run the extractors needed for
+            these output tables. Defaults to all of them.
+
+    Returns:
+        dict: key -> ColumnarTable of rows (see new_tables()).
+    """
+    tables = new_tables()
+    extractors = {
+        SECTION_EXTRACTORS[key] for key in (OUTPUT_TABLES if sections is None else sections)
+    }
 
-                # Save IgE Total
-                if "IGE total" in allergen:
-                    ige_total = value
-                    continue
+    # Opened once for the layout and every extractor
+    with pdf_document(pdf_path) as doc:
+        layout = identify_layout(pdf_path, "blood", doc)
+        header = extract_header_info(pdf_path, layout, doc)
+        nhc = header.get("nhc", "NA").lstrip("0")
+        study_id = nhc_to_id.get(nhc, f"UNKNOWN_NHC_{nhc}")
+        # The sample date is part of the key of every table (see TABLE_KEYS)
+        date = header["sample_reception_date"]
+
+        where = location(header["page"], header["bbox"])
+        tables["metadata"].append_values(
+            (study_id, header["name"], date, header["birth_date"], *where)
+        )
+        if "haemogram" in extractors:
+            extract_haemogram_values(pdf_path, tables, study_id, date, layout, doc)
+        if "ige" in extractors:
+            extract_ige_values(pdf_path, tables, study_id, date, layout, doc)
 
-                # Skip if does not contains IgE
-                if "IgE" not in allergen:
-                    continue
+    return tables
 
-                # Skip if there's no unit (to filter non-result lines)
-                if not unit:
-                    continue
 
-                # Check bold
-                bold = any(
-                    value in span.get("text", "") and "Bold" in span.get("font", "")
-                    for block in styled_blocks
-                    for line in block.get("lines", [])
-                    for span in line.get("spans", [])
-                )
+def output_tables(output_dir):
+    """Return (output CSV path, fieldnames) for each table in OUTPUT_TABLES."""
+    return {
+        key: (os.path.join(output_dir, subdir, filename), fieldnames)
+        for key, (subdir, filename, fieldnames) in OUTPUT_TABLES.items()
+    }
 
-                # Skip if not bold
-                if not bold:
-                    continue
 
-                entry = {
-                    "allergen": allergen,
-                    "value": value,
-                    "unit": unit,
-                    "ref_interval": ref_interval,
-                }
-                if current_section == "AL·LÈRGENS ESPECÍFICS" and current_subgroup:
-                    specifics.setdefault(current_subgroup, []).append(entry)
-                elif current_section == "AL·LÈRGENS RECOMBINANTS":
-                    recombinants.append(entry)
-    doc.close()
-    return ige_total, specifics, recombinants
-
-
-def main():
+def reextract(args, nhc_to_id, index):
+    """
+    Re-extract only the rows selected with --only-* in the provenance index.
+
+    The source files of the selected rows are re-run with just the extractors
+    of the selected sections, and those rows are replaced in the outputs.
+    """
+    pairs, filenames = index.select(args.only_version, args.only_section, args.only_id)
+    if not pairs:
+        print("⚠️ No extracted rows match the selection.")
+        return
+
+    missing = [f for f in filenames if not os.path.isfile(os.path.join(args.input_dir, f))]
+    if missing:
+        print(f"❌ Error: Source files not found in '{args.input_dir}': {', '.join(missing)}")
+        return
+
+    sections = sorted({section for _, section in pairs})
+    print(f"🔁 Re-extracting {len(pairs)} patient sections from {len(filenames)} files...")
+    new_rows = {key: [] for key in sections}
+    for filename in filenames:
+        pdf_path = os.path.join(args.input_dir, filename)
+        print(f"📄 Processing {filename}...")
+        rows = process_pdf(pdf_path, nhc_to_id, sections)
+        study_id = rows["metadata"].column("id")[0]
+        selected = [key for key in sections if (study_id, key) in pairs]
+        for key in selected:
+            new_rows[key].extend(rows[key])
+        index.record(filename, file_sha256(pdf_path), rows, selected)
+
+    tables = output_tables(args.output_dir)
+    for key in sections:
+        path, fieldnames = tables[key]
+        study_ids = {study_id for study_id, section in pairs if section == key}
+        replace_rows(path, fieldnames, study_ids, new_rows[key])
+        print(f"✅ Replaced {len(new_rows[key])} rows in {path}")
+        if os.path.isdir(parquet_dir(path)):
+            print(f"⚠️ {parquet_dir(path)} was not updated; rerun with --parquet to rebuild it.")
+
+
+def main(argv=None):
     """Main function to orchestrate the PDF processing."""
-    args = parse_arguments()
+    args = parse_arguments(argv)
 
     # --- Validate Input Arguments ---
     if not os.path.isdir(args.input_dir):
@@ -200,16 +450,18 @@ def main():
     if not os.path.isfile(args.mapping_file):
         print(f"❌ Error: Mapping file '{args.mapping_file}' does not exist.")
         return
+    if args.parquet and args.upsert:
+        print("❌ Error: --parquet is written by full runs and cannot be used with --upsert.")
+        return
 
     # --- Setup Directories and Paths ---
+    # A shard writes its own outputs, combined later with `breathe.py merge`
+    if args.shard:
+        args.output_dir = shard_output_dir(args.output_dir, args.shard)
     # Create main output directory and subdirectories
-    hematology_dir = os.path.join(args.output_dir, "hematology")
-    immunology_dir = os.path.join(args.output_dir, "immunology")
-
     try:
-        os.makedirs(args.output_dir, exist_ok=True)
-        os.makedirs(hematology_dir, exist_ok=True)
-        os.makedirs(immunology_dir, exist_ok=True)
+        for subdir in {subdir for subdir, _, _ in OUTPUT_TABLES.values()}:
+            os.makedirs(os.path.join(args.output_dir, subdir), exist_ok=True)
     except PermissionError:
         print(
             f"❌ Error: Cannot write to output directory '{args.output_dir}'. Check permissions."
@@ -219,96 +471,112 @@ def main():
         print(f"❌ Error: Failed to create output directories: {e}")
         return
 
-    # Define output file paths
-    csv_metadata = os.path.join(args.output_dir, "metadata_auto.csv")
-    csv_haemogram = os.path.join(hematology_dir, "hemograma_auto.csv")
-    csv_leucocytes = os.path.join(hematology_dir, "leucocitos_auto.csv")
-    csv_ige_total = os.path.join(immunology_dir, "ige_total_auto.csv")
-    csv_ige_specific = os.path.join(immunology_dir, "ige_specific_auto.csv")
-    csv_ige_recombinant = os.path.join(immunology_dir, "ige_recombinant_auto.csv")
-
-    # --- Load Mapping ---
+    # --- Load Mapping and Layouts ---
     nhc_to_id = load_nhc_mapping(args.mapping_file)
+    if args.layouts:
+        load_templates(args.layouts)
+    index = ProvenanceIndex(args.output_dir, "blood", EXTRACTOR_VERSION)
+
+    if args.reextract:
+        reextract(args, nhc_to_id, index)
+        index.close()
+        return
 
-    # --- Initialize Data Lists ---
-    header_rows, haemogram_rows, leucocyte_rows = [], [], []
-    ige_total_rows, ige_specific_rows, ige_recombinant_rows = [], [], []
+    # --- Initialize Outputs ---
+    # Results are flushed every --chunk-size files, so memory stays flat
+    if args.upsert:
+        writer = KeyedWriter(
+            output_tables(args.output_dir),
+            TABLE_KEYS,
+            args.output_dir,
+            args.input_dir,
+            chunk_size=args.chunk_size,
+        )
+    else:
+        writer = CheckpointedWriter(
+            output_tables(args.output_dir),
+            args.output_dir,
+            chunk_size=args.chunk_size,
+            resume=args.resume,
+            parquet=args.parquet,
+        )
+        if not args.resume:
+            index.clear()
     errors = []
+    failed_files = set()
 
     # --- Process each PDF file ---
     print(f"📁 Processing PDFs from: {args.input_dir}")
-    for filename in os.listdir(args.input_dir):
-        if not filename.lower().endswith(".pdf"):
-            continue
-
-        pdf_path = os.path.join(args.input_dir, filename)
+    filenames = os.listdir(args.input_dir)
+    pdf_paths = [
+        os.path.join(args.input_dir, filename)
+        for filename in filenames
+        if filename.lower().endswith(".pdf") and in_shard(filename, args.shard)
+    ]
+    # Oldest first, so a later report wins a key it shares with an earlier one
+    pdf_paths = [path for path in oldest_first(pdf_paths) if not writer.done(path)]
+    # Files are read ahead on background threads while earlier ones are parsed
+    for pdf_path in prefetch(pdf_paths, args.prefetch):
+        filename = os.path.basename(pdf_path)
         print(f"📄 Processing {filename}...")
 
         try:
-            header = extract_header_info(pdf_path)
-            haemogram_results, leucocyte_results = extract_haemogram_values(pdf_path)
-            ige_total, ige_specifics, ige_recombinants = extract_ige_values(pdf_path)
-
-            nhc = header.get("nhc", "NA").lstrip("0")
-            study_id = nhc_to_id.get(nhc, f"UNKNOWN_NHC_{nhc}")
-
-            # Append data to lists
-            header["id"] = study_id
-            header_rows.append(header)
-
-            for entry in haemogram_results:
-                entry["id"] = study_id
-                haemogram_rows.append(entry)
-
-            for entry in leucocyte_results:
-                entry["id"] = study_id
-                leucocyte_rows.append(entry)
-
-            if ige_total != "NA":
-                ige_total_rows.append({"id": study_id, "value": ige_total})
-
-            for subgroup, items in ige_specifics.items():
-                for entry in items:
-                    entry["id"] = study_id
-                    entry["subgroup"] = subgroup
-                    ige_specific_rows.append(entry)
-
-            for entry in ige_recombinants:
-                entry["id"] = study_id
-                ige_recombinant_rows.append(entry)
-
+            rows = process_pdf(pdf_path, nhc_to_id)
+            index.record(filename, file_sha256(pdf_path), rows)
+            writer.add(filename, rows)
         except Exception as e:
             error_msg = f"Failed to process {filename}: {e}"
             print(f"❌ [ERROR] {error_msg}")
             traceback.print_exc()
             errors.append(error_msg)
+            failed_files.add(filename)
             continue
 
-    # --- Write all data to CSV files ---
-    write_csv(
-        csv_metadata, ["id", "name", "sample_reception_date", "birth_date"], header_rows
-    )
-    write_csv(csv_haemogram, ["id", "parameter", "value", "unit"], haemogram_rows)
-    write_csv(csv_leucocytes, ["id", "parameter", "value", "unit"], leucocyte_rows)
-    write_csv(csv_ige_total, ["id", "value"], ige_total_rows)
-    write_csv(
-        csv_ige_specific,
-        ["id", "subgroup", "allergen", "value", "unit", "ref_interval"],
-        ige_specific_rows,
-    )
-    write_csv(
-        csv_ige_recombinant,
-        ["id", "allergen", "value", "unit", "ref_interval"],
-        ige_recombinant_rows,
-    )
+    # --- Write remaining data to CSV files ---
+    writer.close()
+    if not args.watch:
+        index.close()
 
     print("\n[OK] Extraction completed.")
+    if args.upsert:
+        print(f"🔑 Upserted records: {writer.inserted} new, {writer.updated} updated")
     print(f"✅ Results saved in: {args.output_dir}")
     if errors:
         print("\n[SUMMARY] Errors occurred during processing:")
         for err in errors:
             print(f" - {err}")
 
+    # --- Watch for new reports ---
+    if args.watch:
+
+        def on_new_files(pdf_paths):
+            failed = []
+            for pdf_path in pdf_paths:
+                print(f"📄 New report: {os.path.basename(pdf_path)}")
+                try:
+                    rows = process_pdf(pdf_path, nhc_to_id)
+                    index.record(os.path.basename(pdf_path), file_sha256(pdf_path), rows)
+                    writer.add(os.path.basename(pdf_path), rows)
+                except Exception as e:
+                    print(f"❌ [ERROR] Failed to process {pdf_path}: {e}")
+                    traceback.print_exc()
+                    # Possibly still being written: retried once the file changes
+                    failed.append(pdf_path)
+                    continue
+                writer.flush()
+                print(f"✅ Appended results for {os.path.basename(pdf_path)}")
+            return failed
+
+        writer.atomic = True
+        watch_directory(
+            args.input_dir,
+            lambda name: name.lower().endswith(".pdf") and in_shard(name, args.shard),
+            on_new_files,
+            known=[f for f in filenames if f not in failed_files],
+            interval=args.poll_interval,
+            poll=args.poll,
+        )
+
 
 if __name__ == "__main__":
     main()
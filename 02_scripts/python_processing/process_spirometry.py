@@ -1,15 +1,102 @@
 #!/usr/bin/env python3
 import os
-import glob
 import argparse
 import traceback
 import re
-import pandas as pd
-import fitz  # PyMuPDF
 from utils import load_nhc_mapping
-
-
-def parse_arguments():
+from checkpoint import add_checkpoint_arguments, parquet_dir, CheckpointedWriter
+from watch import add_watch_arguments, watch_directory
+from layouts import add_layout_arguments, load_templates, identify_layout, get_template
+from prefetch import add_prefetch_arguments, prefetch, open_pdf, pdf_document
+from shard import add_shard_arguments, in_shard, shard_output_dir
+from upsert import add_upsert_arguments, oldest_first, KeyedWriter
+from columnar import ColumnarTable
+from provenance import (
+    add_provenance_arguments,
+    file_sha256,
+    location,
+    ProvenanceIndex,
+    replace_rows,
+    LOCATION_COLUMNS,
+    LOCATION_TYPES,
+)
+
+OUTPUT_COLUMNS = ["id", "nhc", "date", "parameter", "phase", "value_type", "value"]
+HISTORY_COLUMNS = ["id", "nhc", "report_date", "date", "parameter", "value"]
+MEASUREMENT_COLUMNS = [
+    "id",
+    "nhc",
+    "date",
+    "parameter",
+    "unit",
+    "value",
+    "theorical",
+    "lin",
+    "pct_theorical",
+    "z_score",
+]
+
+# Output tables: key -> (file name, columns)
+OUTPUT_TABLES = {
+    "spirometry": ("spirometry_auto.csv", OUTPUT_COLUMNS),
+    "history": ("spirometry_history_auto.csv", HISTORY_COLUMNS),
+    "lung_volumes": ("lung_volumes_auto.csv", MEASUREMENT_COLUMNS),
+    "diffusion": ("diffusion_auto.csv", MEASUREMENT_COLUMNS),
+}
+
+# Columns identifying a record of each table, for --upsert. History points
+# repeated in later reports are kept once, with their latest value.
+TABLE_KEYS = {
+    "spirometry": ["id", "date", "parameter", "phase", "value_type"],
+    "history": ["id", "date", "parameter"],
+    "lung_volumes": ["id", "date", "parameter"],
+    "diffusion": ["id", "date", "parameter"],
+}
+
+# Report sections, in the order their anchors are checked
+REPORT_SECTIONS = ["spirometry", "history", "lung_volumes", "diffusion"]
+
+# Parameters of the forced spirometry and HISTÒRIC tables
+SPIROMETRY_PARAMETERS = ["FVC", "FEV1", "FEV1/FVC", "MEF", "PEF"]
+
+# Parameters read from the plethysmography and diffusion sections
+SECTION_PARAMETERS = {
+    "lung_volumes": ["TLC", "RV", "FRC"],
+    "diffusion": ["DLCO", "KCO"],
+}
+
+# Table header (after associate_repeated_headers) -> typed column of the
+# lung volume and diffusion tables; PostBD columns are not kept
+HEADER_COLUMNS = {
+    "Pre": "value",
+    "Teòric": "theorical",
+    "LIN": "lin",
+    "Pre.%Teòric": "pct_theorical",
+    "Pre.Z-Score": "z_score",
+}
+
+# Typed (float) columns of the lung volume and diffusion tables, the last ones
+# of MEASUREMENT_COLUMNS
+MEASURED_COLUMNS = list(HEADER_COLUMNS.values())
+
+# Columns with few distinct values, dictionary-encoded in memory (see ColumnarTable)
+CATEGORICAL_COLUMNS = {
+    "id",
+    "nhc",
+    "date",
+    "report_date",
+    "parameter",
+    "phase",
+    "value_type",
+    "unit",
+}
+
+# Recorded with every extracted row in the provenance index; bump it when a
+# parser change alters the output, so affected rows can be re-extracted.
+EXTRACTOR_VERSION = "1.4"
+
+
+def parse_arguments(argv=None):
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(
         description="Extract data from spirometry PDFs and save to structured CSV files."
@@ -21,25 +108,31 @@ def parse_arguments():
     parser.add_argument(
         "mapping_file", help="Path to the NHC to study ID mapping CSV file."
     )
-    return parser.parse_args()
+    add_watch_arguments(parser)
+    add_layout_arguments(parser)
+    add_checkpoint_arguments(parser)
+    add_provenance_arguments(parser)
+    add_prefetch_arguments(parser)
+    add_shard_arguments(parser)
+    add_upsert_arguments(parser)
+    return parser.parse_args(argv)
 
 
-def extract_patient_info(text):
+def extract_patient_info(text, layout=None):
     """
     Extracts only the NHC and the exploration date from the PDF text.
     """
+    labels = (layout or get_template("hcb_spirometry"))["labels"]
     patient_info = {}
     lines = text.splitlines()
 
     for line in lines:
         line = line.strip()
-        if "NHC :" in line and "Edat" in line:
-            parts = line.split("Edat")
+        if labels["nhc"] in line and labels["age"] in line:
+            parts = line.split(labels["age"])
             patient_info["nhc"] = parts[0].split(":")[-1].strip()
         # Robust extraction for exploration date
-        match = re.search(
-            r"Data exploraci[oó]\s*:?\s*([0-9]{2}/[0-9]{2}/[0-9]{4})", line
-        )
+        match = re.search(labels["date"], line)
         if match:
             patient_info["date"] = match.group(1)
 
@@ -105,210 +198,437 @@ def associate_repeated_headers(headers):
     return associated_headers
 
 
-def extract_spirometry_data(file_path):
+def locate_lines(page, textpage=None):
     """
-    Extracts the values from the 'ESPIROMETRIA FORÇADA' section of a PDF file.
-    Handles different dynamic column formats.
+    Return the bounding box of each text line on a page, keyed by the line's
+    first word (first occurrence in reading order only). Pass the page's
+    `textpage` to reuse an extraction already done.
     """
-    print(f"\nProcessing file: {file_path}")  # Debug: file in process
+    lines = {}
+    words = page.get_text("words", sort=True, textpage=textpage)
+    for x0, y0, x1, y1, text, block_no, line_no, _ in words:
+        lines.setdefault((block_no, line_no), []).append((x0, y0, x1, y1, text))
+
+    locations = {}
+    for line_words in lines.values():
+        bbox = (
+            min(w[0] for w in line_words),
+            min(w[1] for w in line_words),
+            max(w[2] for w in line_words),
+            max(w[3] for w in line_words),
+        )
+        locations.setdefault(line_words[0][4], bbox)
+    return locations
 
-    # Open the PDF file
-    try:
-        doc = fitz.open(file_path)
-        text = doc[0].get_text("text", sort=True)
-        doc.close()
-    except Exception as e:
-        print(f"✗ Error opening or reading the PDF file: {file_path} - {str(e)}")
-        return []
 
-    # Extract patient information
+def to_float(value):
+    """Convert a report value ("6.10", "6,10") to float, or None if missing."""
     try:
-        patient_info = extract_patient_info(text)
-    except Exception as e:
-        print(f"✗ Error extracting patient information: {str(e)}")
-        return []
+        return float(value.replace(",", "."))
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_measurement_line(line, headers, parameters):
+    """
+    Parses a lung volume or diffusion line (e.g. "TLC(L)  6.10  6.00 ...")
+    into (parameter, unit, values), with the values of MEASURED_COLUMNS as
+    floats (None if missing).
+
+    Returns None if the line does not hold one of `parameters`.
+    """
+    match = re.match(r"^\s*([A-Z]+[A-Z0-9/]*)(?:\(([^)]+)\))?", line)
+    if not match or match.group(1) not in parameters:
+        return None
+
+    measured = [None] * len(MEASURED_COLUMNS)
+    values = re.split(r"\s{2,}", line[match.end() :].strip())
+    for header, value in zip(headers, values):
+        column = HEADER_COLUMNS.get(header)
+        if column:
+            measured[MEASURED_COLUMNS.index(column)] = to_float(value)
+    return match.group(1), match.group(2) or "NA", measured
+
+
+def parse_history_header(line, label):
+    """
+    Return the parameter columns of a HISTÒRIC header line ("Data  FVC(L)
+    FEV1(L) ..."), or None if the line is not that header: it must start
+    with the `label` column and be followed only by known parameters.
+    """
+    columns = re.split(r"\s{2,}", line.strip())
+    if columns[0] != label or len(columns) < 2:
+        return None
+    if not all(
+        column.startswith(tuple(SPIROMETRY_PARAMETERS)) for column in columns[1:]
+    ):
+        return None
+    return columns[1:]
+
+
+def iter_page_lines(doc):
+    """
+    Lazily yield (page, textpage, lines) for each page of a document, where
+    lines are the stripped, non-empty lines of the page text. A page is only
+    read when the caller asks for it, and its text page is parsed once and
+    handed out for further lookups on the same page.
+    """
+    for page in doc:
+        textpage = page.get_textpage()
+        text = page.get_text("text", sort=True, textpage=textpage)
+        yield page, textpage, [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def new_table(key):
+    """
+    Return an empty table for the rows of one report of an OUTPUT_TABLES key:
+    the output columns, then the location of the row (LOCATION_COLUMNS) for
+    the provenance index.
+    """
+    _, fieldnames = OUTPUT_TABLES[key]
+    numeric = dict(LOCATION_TYPES)
+    if key in SECTION_PARAMETERS:
+        numeric.update((column, "d") for column in MEASURED_COLUMNS)
+    return ColumnarTable(fieldnames + LOCATION_COLUMNS, CATEGORICAL_COLUMNS, numeric)
 
-    # Split the text into lines and trim spaces
-    lines = text.splitlines()
-    lines = [line.strip() for line in lines if line.strip()]
 
-    # Search for the "ESPIROMETRIA FORÇADA" section
-    spirometry_data = []
-    spirometry_section = False
+def extract_spirometry_report(file_path, layout=None, doc=None):
+    """
+    Extracts every section of a spirometry report in one pass over its lines:
+    'ESPIROMETRIA FORÇADA', 'HISTÒRIC', 'VOLUMS PULMONARS' and 'DIFUSIÓ'.
+
+    Pages are read lazily and reading stops once every section has been
+    found, so a single-page report is read once. The HISTÒRIC table is
+    followed onto the next pages as long as they keep adding rows to it.
+
+    Returns:
+        dict: "spirometry" -> records of the current exploration (one dict
+        per parameter, keyed by the table headers, which vary between
+        reports), "history" -> table of one row per past exploration date
+        and parameter, "lung_volumes" and "diffusion" -> tables of one
+        typed row per parameter (TLC/RV/FRC, DLCO/KCO). The tables are
+        those of new_table(), with an empty study ID.
+
+    Pass `doc` to read a report the caller already opened (it is left open).
+    """
+    layout = layout or get_template("hcb_spirometry")
+    sections = layout["sections"]
+    report = {key: new_table(key) for key in REPORT_SECTIONS if key != "spirometry"}
+    report["spirometry"] = []
+    print(f"\nProcessing file: {file_path}")  # Debug: file in process
+
+    # Open the PDF file, unless the caller already did
+    close = doc is None
+    if close:
+        try:
+            doc = open_pdf(file_path)
+        except Exception as e:
+            print(f"✗ Error opening or reading the PDF file: {file_path} - {str(e)}")
+            return report
+
+    # Section -> anchor; templates may leave out the optional sections
+    anchors = {key: sections[key] for key in REPORT_SECTIONS if sections.get(key)}
+    patient_info = None
+    current_section = None
+    found = set()
     headers = None
+    history_columns = None
+    measurement_headers = {}
 
-    for line in lines:
-        if "ESPIROMETRIA FORÇADA" in line:
-            spirometry_section = True
-            continue
+    try:
+        for page, textpage, lines in iter_page_lines(doc):
+            # Extract patient information (first page)
+            if patient_info is None:
+                try:
+                    patient_info = extract_patient_info("\n".join(lines), layout)
+                except Exception as e:
+                    print(f"✗ Error extracting patient information: {str(e)}")
+                    return report
+
+            locations = None
+            history_rows = 0
+            for line in lines:
+                # Detect section changes
+                section = next(
+                    (key for key, anchor in anchors.items() if anchor in line), None
+                )
+                if section:
+                    current_section = section
+                    found.add(current_section)
+                    continue
+                if any(keyword in line for keyword in sections["end_spirometry"]):
+                    current_section = None
+                    continue
+
+                if current_section == "spirometry":
+                    # Detect header line
+                    if re.search(layout["header_pattern"], line, re.IGNORECASE):
+                        headers = normalize_headers(line)
+                        headers = associate_repeated_headers(headers)
+                        # print(f"Headers found: {headers}")  # Debug
+                        continue
+
+                    # Process data lines
+                    if any(param in line for param in SPIROMETRY_PARAMETERS):
+                        try:
+                            param_match = re.match(
+                                r"^\s*([A-Z]+[A-Z0-9/]*(?:\([^)]+\))?)", line
+                            )
+                            if param_match:
+                                param_name = param_match.group(1)
+                                values_part = line[param_match.end() :].strip()
+                                values = re.split(r"\s{2,}", values_part)
+                                values = [v.strip() for v in values if v.strip()]
+
+                                if locations is None:
+                                    locations = locate_lines(page, textpage)
+                                data_row = dict(patient_info)
+                                data_row["parametro"] = param_name
+                                data_row["page"] = page.number
+                                data_row["bbox"] = locations.get(param_name)
+
+                                if headers:
+                                    # Filter relevant headers for FEV1/FVC(%)
+                                    if param_name.startswith("FEV1/FVC"):
+                                        relevant_headers = [
+                                            "Pre",
+                                            "Teòric",
+                                            "LIN",
+                                            "PostBD",
+                                        ]
+                                    else:
+                                        relevant_headers = headers
+
+                                    for i, value in enumerate(values):
+                                        if i < len(relevant_headers) and value != "----":
+                                            data_row[relevant_headers[i]] = value
+                                    report["spirometry"].append(data_row)
+                                else:
+                                    print(
+                                        f"✗ No headers found in {file_path}. Line: {line}"
+                                    )
+                                    continue
+                        except Exception as e:
+                            print(
+                                f"✗ Error processing line: {line} - {str(e)}"
+                            )  # Debug: line error
+
+                elif current_section == "history":
+                    # Column header: "Data  FVC(L)  FEV1(L)  FEV1/FVC(%)". The
+                    # "Data exploració:" page header is not one, and must not
+                    # reset the columns of a table running onto the next page.
+                    columns = parse_history_header(line, sections["history_header"])
+                    if columns:
+                        history_columns = columns
+                        continue
+
+                    # One row per past exploration, starting with its date
+                    date_match = re.match(layout["history_row_pattern"], line)
+                    if not date_match or not history_columns:
+                        continue
+                    history_rows += 1
+                    if locations is None:
+                        locations = locate_lines(page, textpage)
+                    date = date_match.group(1)
+                    where = location(page.number, locations.get(date))
+                    values = re.split(r"\s{2,}", line[date_match.end() :].strip())
+                    for parameter, value in zip(history_columns, values):
+                        if value == "----":
+                            continue
+                        report["history"].append_values(
+                            (
+                                None,
+                                patient_info.get("nhc"),
+                                patient_info.get("date"),
+                                date,
+                                parameter,
+                                value,
+                                *where,
+                            )
+                        )
+
+                elif current_section in SECTION_PARAMETERS:
+                    if re.search(layout["header_pattern"], line, re.IGNORECASE):
+                        measurement_headers[current_section] = associate_repeated_headers(
+                            normalize_headers(line)
+                        )
+                        continue
+
+                    measurement = parse_measurement_line(
+                        line,
+                        measurement_headers.get(current_section, []),
+                        SECTION_PARAMETERS[current_section],
+                    )
+                    if measurement is None:
+                        continue
+                    parameter, unit, measured = measurement
+                    if locations is None:
+                        locations = locate_lines(page, textpage)
+                    report[current_section].append_values(
+                        (
+                            None,
+                            patient_info.get("nhc"),
+                            patient_info.get("date"),
+                            parameter,
+                            unit,
+                            *measured,
+                            *location(page.number, locations.get(line.split()[0])),
+                        )
+                    )
 
-        if spirometry_section:
-            # Detect end of section
-            if any(
-                keyword in line
-                for keyword in ["HISTÒRIC", "VOLUMS PULMONARS", "DIFUSIÓ"]
+            # Stop once every section is found, unless HISTÒRIC may go on
+            if set(anchors) <= found and not (
+                current_section == "history" and history_rows
             ):
                 break
+    except Exception as e:
+        print(f"✗ Error opening or reading the PDF file: {file_path} - {str(e)}")
+    finally:
+        if close:
+            doc.close()
 
-            # Detect header line
-            if re.search(r"Pre\s+Teòric|Pre\s+Teòric\s+LIN", line, re.IGNORECASE):
-                headers = normalize_headers(line)
-                headers = associate_repeated_headers(headers)
-                # print(f"Headers found: {headers}")  # Debug
-                continue
+    return report
 
-            # Process data lines
-            if any(
-                param in line for param in ["FVC", "FEV1", "FEV1/FVC", "MEF", "PEF"]
-            ):
-                try:
-                    param_match = re.match(
-                        r"^\s*([A-Z]+[A-Z0-9/]*(?:\([^)]+\))?)", line
-                    )
-                    if param_match:
-                        param_name = param_match.group(1)
-                        values_part = line[param_match.end() :].strip()
-                        # if param_name.startswith("FEV1/FVC"):
-                        #     print(f"Processing values: {values_part}")
-                        values = re.split(r"\s{2,}", values_part)
-                        values = [v.strip() for v in values if v.strip()]
-                        # if param_name.startswith("FEV1/FVC"):
-                        #     print(f"Values found for {param_name}: {values}")
-
-                        data_row = dict(patient_info)
-                        data_row["parametro"] = param_name
-
-                        if headers:
-                            # Filter relevant headers for FEV1/FVC(%)
-                            if param_name.startswith("FEV1/FVC"):
-                                relevant_headers = ["Pre", "Teòric", "LIN", "PostBD"]
-                            else:
-                                relevant_headers = headers
-
-                            for i, value in enumerate(values):
-                                if i < len(relevant_headers) and value != "----":
-                                    data_row[relevant_headers[i]] = value
-                            spirometry_data.append(data_row)
-                        else:
-                            print(f"✗ No headers found in {file_path}. Line: {line}")
-                            continue
-                except Exception as e:
-                    print(
-                        f"✗ Error processing line: {line} - {str(e)}"
-                    )  # Debug: line error
 
-    return spirometry_data
+def extract_spirometry_data(file_path, layout=None):
+    """
+    Extracts the values from the 'ESPIROMETRIA FORÇADA' section of a PDF file.
+    Handles different dynamic column formats.
+    """
+    return extract_spirometry_report(file_path, layout)["spirometry"]
 
 
-def transform_spirometry_data(spirometry_data):
+def spirometry_rows(spirometry_data):
     """
-    Transforms the spirometry data into a detailed tabular structure.
+    Transforms the spirometry records into long rows (one per phase and value
+    type), appended to a new_table("spirometry").
     """
-    transformed_data = []
+    table = new_table("spirometry")
 
     for entry in spirometry_data:
-        nhc = entry.get("nhc")
-        fecha = entry.get("date")
-        param = entry.get("parametro")
+        # id, nhc, date and parameter, then the row location
+        base = tuple(entry.get(key) for key in ("id", "nhc", "date", "parametro"))
+        where = location(entry.get("page"), entry.get("bbox"))
         theorical = entry.get("Teòric")
         lin = entry.get("LIN")
 
         # Process values for each phase (Pre, Post, etc.)
         for header in entry.keys():
             if header.startswith("Pre."):
-                phase = "Pre"
-                value_type = header.split(".", 1)[
-                    1
-                ]  # Extract the value type (e.g., "%Teòric")
-                transformed_data.append(
-                    {
-                        "nhc": nhc,
-                        "date": fecha,
-                        "parameter": param,
-                        "phase": phase,
-                        "value_type": value_type,
-                        "value": entry[header],
-                    }
-                )
+                # Extract the value type (e.g., "%Teòric")
+                phase, value_type = "Pre", header.split(".", 1)[1]
             elif header.startswith("Post.") or header.startswith("PostBD."):
-                phase = "PostBD"  # header.split(".", 1)[0]  # Assign phase PostBD
-                value_type = header.split(".", 1)[1]
-                transformed_data.append(
-                    {
-                        "nhc": nhc,
-                        "date": fecha,
-                        "parameter": param,
-                        "phase": phase,
-                        "value_type": value_type,
-                        "value": entry[header],
-                    }
-                )
+                phase, value_type = "PostBD", header.split(".", 1)[1]
             elif header == "Pre":
-                transformed_data.append(
-                    {
-                        "nhc": nhc,
-                        "date": fecha,
-                        "parameter": param,
-                        "phase": "Pre",
-                        "value_type": "raw",
-                        "value": entry[header],
-                    }
-                )
+                phase, value_type = "Pre", "raw"
             elif header == "Post" or header == "PostBD":
-                transformed_data.append(
-                    {
-                        "nhc": nhc,
-                        "date": fecha,
-                        "parameter": param,
-                        "phase": "PostBD",
-                        "value_type": "raw",
-                        "value": entry[header],
-                    }
-                )
+                phase, value_type = "PostBD", "raw"
+            else:
+                continue
+            table.append_values((*base, phase, value_type, entry[header], *where))
 
         # Add general values (without specific phase)
         if theorical:
-            transformed_data.append(
-                {
-                    "nhc": nhc,
-                    "date": fecha,
-                    "parameter": param,
-                    "phase": "Not applicable",
-                    "value_type": "theorical",
-                    "value": theorical,
-                }
-            )
+            table.append_values((*base, "Not applicable", "theorical", theorical, *where))
         if lin:
-            transformed_data.append(
-                {
-                    "nhc": nhc,
-                    "date": fecha,
-                    "parameter": param,
-                    "phase": "Not applicable",
-                    "value_type": "lin",
-                    "value": lin,
-                }
-            )
+            table.append_values((*base, "Not applicable", "lin", lin, *where))
         if "%Canvi" in entry:
-            transformed_data.append(
-                {
-                    "nhc": nhc,
-                    "date": fecha,
-                    "parameter": param,
-                    "phase": "Not applicable",
-                    "value_type": "%change",
-                    "value": entry["%Canvi"],
-                }
+            table.append_values(
+                (*base, "Not applicable", "%change", entry["%Canvi"], *where)
             )
 
+    return table
+
+
+def transform_spirometry_data(spirometry_data):
+    """
+    Transforms the spirometry data into a detailed tabular structure.
+    """
+    import pandas as pd
+
     # Convert to DataFrame for easier handling
-    df = pd.DataFrame(transformed_data)
+    table = spirometry_rows(spirometry_data)
+    df = pd.DataFrame({column: table.column(column) for column in table.columns})
     return df
 
 
-def main():
+def process_pdf(pdf_file, nhc_to_id):
+    """
+    Extract the tables of one spirometry PDF, keyed as in OUTPUT_TABLES,
+    and tag every row with the study ID.
+
+    Returns:
+        dict: key -> ColumnarTable of rows (see new_table()).
+    """
+    # Opened once for the layout and the report
+    with pdf_document(pdf_file) as doc:
+        layout = identify_layout(pdf_file, "spirometry", doc)
+        report = extract_spirometry_report(pdf_file, layout, doc)
+    rows = dict(report, spirometry=spirometry_rows(report["spirometry"]))
+
+    # Add study ID mapping to each table (a report is about one patient)
+    for table in rows.values():
+        if len(table):
+            nhc = (table.column("nhc")[0] or "NA").lstrip("0")
+            table.fill("id", nhc_to_id.get(nhc, f"UNKNOWN_NHC_{nhc}"))
+
+    return rows
+
+
+def output_tables(output_dir):
+    """Return (output CSV path, fieldnames) for each table in OUTPUT_TABLES."""
+    return {
+        key: (os.path.join(output_dir, filename), fieldnames)
+        for key, (filename, fieldnames) in OUTPUT_TABLES.items()
+    }
+
+
+def reextract(args, nhc_to_id, index):
+    """
+    Re-extract only the rows selected with --only-* in the provenance index.
+
+    The source files of the selected rows are re-run and those rows are
+    replaced in the outputs.
+    """
+    pairs, filenames = index.select(args.only_version, args.only_section, args.only_id)
+    if not pairs:
+        print("⚠️ No extracted rows match the selection.")
+        return
+
+    missing = [f for f in filenames if not os.path.isfile(os.path.join(args.input_dir, f))]
+    if missing:
+        print(f"❌ Error: Source files not found in '{args.input_dir}': {', '.join(missing)}")
+        return
+
+    sections = sorted({section for _, section in pairs})
+    print(f"🔁 Re-extracting {len(pairs)} patient sections from {len(filenames)} files...")
+    new_rows = {key: [] for key in sections}
+    for filename in filenames:
+        pdf_file = os.path.join(args.input_dir, filename)
+        rows = process_pdf(pdf_file, nhc_to_id)
+        selected = {}
+        for key in sections:
+            ids = rows[key].column("id")
+            selected[key] = rows[key].take(
+                [i for i, study_id in enumerate(ids) if (study_id, key) in pairs]
+            )
+        for key in sections:
+            new_rows[key].extend(selected[key])
+        index.record(filename, file_sha256(pdf_file), selected)
+
+    tables = output_tables(args.output_dir)
+    for key in sections:
+        path, fieldnames = tables[key]
+        study_ids = {study_id for study_id, section in pairs if section == key}
+        replace_rows(path, fieldnames, study_ids, new_rows[key])
+        print(f"✅ Replaced {len(new_rows[key])} rows in {path}")
+        if os.path.isdir(parquet_dir(path)):
+            print(f"⚠️ {parquet_dir(path)} was not updated; rerun with --parquet to rebuild it.")
+
+
+def main(argv=None):
     """Main function to orchestrate the PDF processing."""
-    args = parse_arguments()
+    args = parse_arguments(argv)
 
     # --- Validate Input Arguments ---
     if not os.path.isdir(args.input_dir):
@@ -317,8 +637,14 @@ def main():
     if not os.path.isfile(args.mapping_file):
         print(f"❌ Error: Mapping file '{args.mapping_file}' does not exist.")
         return
+    if args.parquet and args.upsert:
+        print("❌ Error: --parquet is written by full runs and cannot be used with --upsert.")
+        return
 
     # --- Setup Directories and Paths ---
+    # A shard writes its own outputs, combined later with `breathe.py merge`
+    if args.shard:
+        args.output_dir = shard_output_dir(args.output_dir, args.shard)
     # Create output directory if it doesn't exist
     try:
         os.makedirs(args.output_dir, exist_ok=True)
@@ -335,46 +661,86 @@ def main():
 
     # --- Load Mapping ---
     nhc_to_id = load_nhc_mapping(args.mapping_file)
+    if args.layouts:
+        load_templates(args.layouts)
+    index = ProvenanceIndex(args.output_dir, "spirometry", EXTRACTOR_VERSION)
 
-    all_data = []
-    errors = []
+    if args.reextract:
+        reextract(args, nhc_to_id, index)
+        index.close()
+        return
 
     # --- Process each PDF file ---
     print(f"📁 Processing PDFs from: {args.input_dir}")
 
-    # Search for all PDF files in the directory
-    pdf_files = glob.glob(os.path.join(args.input_dir, "*.pdf"))
+    def is_input(name):
+        """PDF reports of this shard, with any case of extension (batch and watch)."""
+        return name.lower().endswith(".pdf") and in_shard(name, args.shard)
+
+    # Search for all PDF files in the directory, oldest first so a later
+    # report wins a key it shares with an earlier one
+    pdf_files = oldest_first(
+        os.path.join(args.input_dir, name)
+        for name in os.listdir(args.input_dir)
+        if is_input(name)
+    )
 
     if not pdf_files:
         print(f"❌ No PDF files found in {args.input_dir}")
-        return
+        if not args.watch:
+            return
+
+    # --- Initialize Output ---
+    # Results are flushed every --chunk-size files, so memory stays flat
+    if args.upsert:
+        writer = KeyedWriter(
+            output_tables(args.output_dir),
+            TABLE_KEYS,
+            args.output_dir,
+            args.input_dir,
+            chunk_size=args.chunk_size,
+        )
+    else:
+        writer = CheckpointedWriter(
+            output_tables(args.output_dir),
+            args.output_dir,
+            chunk_size=args.chunk_size,
+            resume=args.resume,
+            parquet=args.parquet,
+        )
+        if not args.resume:
+            index.clear()
+    n_rows = 0
+    errors = []
+    failed_files = set()
 
-    for pdf_file in pdf_files:
+    # Files are read ahead on background threads while earlier ones are parsed
+    pending = [f for f in pdf_files if not writer.done(f)]
+    for pdf_file in prefetch(pending, args.prefetch):
         filename = os.path.basename(pdf_file)
         print(f"📄 Processing {filename}...")
 
         try:
-            spirometry_data = extract_spirometry_data(pdf_file)
-
-            # Add study ID mapping to each record
-            for record in spirometry_data:
-                nhc = record.get("nhc", "NA").lstrip("0")
-                study_id = nhc_to_id.get(nhc, f"UNKNOWN_NHC_{nhc}")
-                record["id"] = study_id
-
-            all_data.extend(spirometry_data)
+            rows = process_pdf(pdf_file, nhc_to_id)
+            index.record(filename, file_sha256(pdf_file), rows)
+            writer.add(filename, rows)
+            n_rows += len(rows["spirometry"])
         except Exception as e:
             error_msg = f"Failed to process {filename}: {e}"
             print(f"❌ [ERROR] {error_msg}")
             traceback.print_exc()
             errors.append(error_msg)
+            failed_files.add(filename)
             continue
 
-    if all_data:
-        df = transform_spirometry_data(all_data)
-        df.to_csv(output_csv, index=False)
+    writer.close()
+    if not args.watch:
+        index.close()
+    if n_rows or args.resume or args.upsert:
         print(f"\n✅ Data saved to {output_csv}")
         print(f"✅ Results saved in: {args.output_dir}")
+        if args.upsert:
+            print(f"🔑 Upserted records: {writer.inserted} new, {writer.updated} updated")
     else:
         print("\n❌ No spirometry data found in the PDF files.")
 
@@ -383,6 +749,41 @@ def main():
         for err in errors:
             print(f" - {err}")
 
+    # --- Watch for new reports ---
+    if args.watch:
+
+        def on_new_files(pdf_paths):
+            failed = []
+            for pdf_path in pdf_paths:
+                print(f"📄 New report: {os.path.basename(pdf_path)}")
+                try:
+                    rows = process_pdf(pdf_path, nhc_to_id)
+                    index.record(os.path.basename(pdf_path), file_sha256(pdf_path), rows)
+                except Exception as e:
+                    print(f"❌ [ERROR] Failed to process {pdf_path}: {e}")
+                    traceback.print_exc()
+                    # Possibly still being written: retried once the file changes
+                    failed.append(pdf_path)
+                    continue
+                if not rows["spirometry"]:
+                    print(f"⚠️ No spirometry data found in {pdf_path}")
+                writer.add(os.path.basename(pdf_path), rows)
+                writer.flush()
+                print(f"✅ Appended {len(rows['spirometry'])} rows to {output_csv}")
+            return failed
+
+        writer.atomic = True
+        watch_directory(
+            args.input_dir,
+            is_input,
+            on_new_files,
+            known=[
+                os.path.basename(f) for f in pdf_files if os.path.basename(f) not in failed_files
+            ],
+            interval=args.poll_interval,
+            poll=args.poll,
+        )
+
 
 if __name__ == "__main__":
     main()
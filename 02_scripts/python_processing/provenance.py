@@ -0,0 +1,188 @@
+import os
+import csv
+import sqlite3
+import hashlib
+from datetime import datetime
+from itertools import repeat
+from utils import append_csv_atomic
+
+PROVENANCE_FILE = "provenance.sqlite"
+
+# Columns giving the location of every extracted row: page and bounding box
+LOCATION_COLUMNS = ["page", "x0", "y0", "x1", "y1"]
+LOCATION_TYPES = {"page": "i", "x0": "d", "y0": "d", "x1": "d", "y1": "d"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS provenance (
+    id TEXT,
+    section TEXT,
+    row_key TEXT,
+    source_file TEXT,
+    file_hash TEXT,
+    page INTEGER,
+    x0 REAL, y0 REAL, x1 REAL, y1 REAL,
+    extractor TEXT,
+    extractor_version TEXT,
+    extracted_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_provenance_id ON provenance (id);
+CREATE INDEX IF NOT EXISTS idx_provenance_source ON provenance (extractor, source_file);
+CREATE INDEX IF NOT EXISTS idx_provenance_version ON provenance (extractor, extractor_version, section);
+"""
+
+
+def create_schema(connection):
+    """Create the provenance table and its indexes in an SQLite connection."""
+    connection.executescript(_SCHEMA)
+
+
+def location(page, bbox):
+    """Return the LOCATION_COLUMNS values of a row (None for an unknown bbox)."""
+    return (page, *(bbox or (None, None, None, None)))
+
+
+def add_provenance_arguments(parser):
+    """Add the shared re-extraction options to an extractor's argument parser."""
+    parser.add_argument(
+        "--reextract",
+        action="store_true",
+        help="Only re-extract the rows selected with --only-* from the provenance index.",
+    )
+    parser.add_argument(
+        "--only-version", help="Select rows extracted by this extractor version."
+    )
+    parser.add_argument(
+        "--only-section", help="Select rows of this output table (e.g. ige_recombinant)."
+    )
+    parser.add_argument("--only-id", help="Select rows of this study ID (e.g. HCB012).")
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file (from memory for a PrefetchedFile)."""
+    data = getattr(file_path, "data", None)
+    if data is not None:
+        return hashlib.sha256(data).hexdigest()
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ProvenanceIndex:
+    """
+    SQLite side index recording where every extracted row came from.
+
+    One record per output row: study id, output table (section), row key
+    (parameter or allergen), source file and hash, page, bounding box and
+    extractor version. The extractors' tables carry the location of every
+    row in LOCATION_COLUMNS, after the output columns.
+    """
+
+    def __init__(self, output_dir, extractor, version):
+        self.extractor = extractor
+        self.version = version
+        self.connection = sqlite3.connect(os.path.join(output_dir, PROVENANCE_FILE))
+        create_schema(self.connection)
+
+    def record(self, source_file, file_hash, rows, sections=None):
+        """
+        Record the rows extracted from one file (key -> ColumnarTable).
+
+        Previous records of the same file (restricted to `sections` when
+        given) are replaced, so re-running a file never duplicates entries.
+        """
+        sections = list(rows) if sections is None else sections
+        now = datetime.now().isoformat(timespec="seconds")
+        records = []
+        for section in sections:
+            table = rows.get(section)
+            if table is None or not len(table):
+                continue
+            row_key = next(
+                (c for c in ("parameter", "allergen") if c in table.columns), None
+            )
+            records.extend(
+                zip(
+                    table.column("id"),
+                    repeat(section),
+                    table.column(row_key) if row_key else repeat(section),
+                    repeat(source_file),
+                    repeat(file_hash),
+                    *(table.column(c) for c in LOCATION_COLUMNS),
+                    repeat(self.extractor),
+                    repeat(self.version),
+                    repeat(now),
+                )
+            )
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM provenance WHERE extractor = ? AND source_file = ? AND section = ?",
+                [(self.extractor, source_file, section) for section in sections],
+            )
+            self.connection.executemany(
+                "INSERT INTO provenance VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                records,
+            )
+
+    def clear(self):
+        """Drop every record of this extractor (a fresh run rewrites all outputs)."""
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM provenance WHERE extractor = ?", (self.extractor,)
+            )
+
+    def select(self, version=None, section=None, study_id=None):
+        """
+        Return the (id, section) pairs matching the filters, and the source
+        files holding any row of those pairs.
+
+        Returns:
+            tuple: (set of (id, section), sorted list of source files)
+        """
+        conditions, params = ["extractor = ?"], [self.extractor]
+        for column, value in (
+            ("extractor_version", version),
+            ("section", section),
+            ("id", study_id),
+        ):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        pairs = set(
+            self.connection.execute(
+                f"SELECT DISTINCT id, section FROM provenance WHERE {' AND '.join(conditions)}",
+                params,
+            )
+        )
+        files = set()
+        for study_id, section in pairs:
+            files.update(
+                f
+                for (f,) in self.connection.execute(
+                    "SELECT DISTINCT source_file FROM provenance "
+                    "WHERE extractor = ? AND id = ? AND section = ?",
+                    (self.extractor, study_id, section),
+                )
+            )
+        return pairs, sorted(files)
+
+    def close(self):
+        self.connection.close()
+
+
+def replace_rows(file_path, fieldnames, study_ids, new_rows):
+    """
+    Rewrite an output CSV without the rows of `study_ids`, then append `new_rows`.
+
+    The file is replaced in one rename.
+    """
+    kept = []
+    if os.path.isfile(file_path):
+        with open(file_path, "r", newline="", encoding="utf-8") as f:
+            kept = [row for row in csv.DictReader(f) if row["id"] not in study_ids]
+    tmp_path = f"{file_path}.reextract"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    append_csv_atomic(tmp_path, fieldnames, kept + list(new_rows))
+    os.replace(tmp_path, file_path)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+import os
+import sys
+import glob
+import argparse
+
+KEY = ["id", "parameter", "phase"]
+
+# Same names as 03_harmonize_blood_data.R
+BLOOD_RENAME = {
+    "Leucòcits": "leukocytes",
+    "Eosinòfils": "eosinophils",
+    "Neutròfils": "neutrophils",
+    "Limfòcits": "lymphocytes",
+    "Monòcits": "monocytes",
+    "Plaquetes": "platelets",
+    "Hemoglobina": "hemoglobin",
+    "Hematòcrit": "hematocrit",
+    "Volum corpuscular mitjà": "mean_corpuscular_volume",
+    "Concentració d'hemoglobina corpuscular mitjà": "mean_corpuscular_hemoglobin_concentration",
+    "Amplitud de distribució de glòbuls vermells": "red_blood_cell_distribution_width",
+}
+
+# (phase, value_type) in spirometry_auto.csv -> column name in the manual file,
+# after the renaming done in 04_harmonize_spirometry_data.R
+SPIROMETRY_MEASURES = {
+    ("Pre", "raw"): "pre",
+    ("Pre", "%Teòric"): "pre_pct_pred",
+    ("Pre", "Z-Score"): "pre_z_score",
+    ("PostBD", "raw"): "post",
+    ("PostBD", "%Teòric"): "post_pct_pred",
+    ("PostBD", "Z-Score"): "post_z_score",
+    ("Not applicable", "theorical"): "theorical",
+    ("Not applicable", "lin"): "lin",
+    ("Not applicable", "%change"): "pct_change",
+}
+
+
+def parse_arguments(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Compare automatic extractions with manually entered lab and spirometry data."
+    )
+    parser.add_argument(
+        "raw_path",
+        help="Data root containing automatic_extraction/ and manual_entry/.",
+    )
+    parser.add_argument("output_file", help="CSV file for the discrepancy table.")
+    parser.add_argument(
+        "--abs-tol",
+        type=float,
+        default=0.01,
+        help="Absolute tolerance between values (default: 0.01).",
+    )
+    parser.add_argument(
+        "--rel-tol",
+        type=float,
+        default=0.01,
+        help="Relative tolerance, as a fraction of the manual value (default: 0.01).",
+    )
+    parser.add_argument(
+        "--fail-on-mismatch",
+        action="store_true",
+        help="Exit with status 1 if any value differs beyond tolerance.",
+    )
+    return parser.parse_args(argv)
+
+
+def to_numeric(values):
+    """Parse report values such as '<0.35', '12,5' or '7.1/A' into floats."""
+    import pandas as pd
+
+    cleaned = (
+        values.astype(str)
+        .str.replace(r"/[AB]|[<>]", "", regex=True)
+        .str.replace(",", ".", regex=False)
+        .str.strip()
+    )
+    return pd.to_numeric(cleaned, errors="coerce")
+
+
+def normalize_unit(units):
+    """Unit suffix used in the harmonized column names (pct, n, ...)."""
+    return (
+        units.fillna("")
+        .str.strip()
+        .str.replace(r".*10\^9/L$", "n", regex=True)
+        .str.replace("%", "pct", regex=False)
+        .str.replace(" ", "_", regex=False)
+    )
+
+
+def normalize_spirometry_parameter(parameters):
+    """Lowercase parameter names without spaces, as in the R harmonization."""
+    return (
+        parameters.astype(str)
+        .str.lower()
+        .str.replace(r"\s+", "", regex=True)
+        .str.replace("[", "(", regex=False)
+        .str.replace("]", ")", regex=False)
+        .str.replace("fef50%(l/s)", "fef50(l/s)", regex=False)
+        .str.replace("fef25%-75%(l/s)", "fef25-75(l/s)", regex=False)
+    )
+
+
+def load_blood_auto(file_paths):
+    """Load long *_auto.csv blood tables into the reconciliation key."""
+    import pandas as pd
+
+    df = pd.concat((pd.read_csv(f, dtype=str) for f in file_paths), ignore_index=True)
+    parameter = df["parameter"].str.split().str.join(" ").replace(BLOOD_RENAME)
+    return pd.DataFrame(
+        {
+            "id": df["id"],
+            "parameter": parameter + "_" + normalize_unit(df["unit"]),
+            "phase": "",
+            "value": to_numeric(df["value"]),
+        }
+    )
+
+
+def load_blood_manual(file_paths):
+    """Load wide manual blood tables (one column per parameter)."""
+    import pandas as pd
+
+    frames = [pd.read_csv(f, dtype=str) for f in file_paths]
+    long = pd.concat(
+        (df.melt(id_vars="id", var_name="parameter", value_name="value") for df in frames),
+        ignore_index=True,
+    )
+    long["phase"] = ""
+    long["value"] = to_numeric(long["value"])
+    return long[KEY + ["value"]]
+
+
+def load_spirometry_auto(file_path):
+    """Load spirometry_auto.csv (long, one row per phase and value type)."""
+    import pandas as pd
+
+    df = pd.read_csv(file_path, dtype=str)
+    measures = pd.Series(SPIROMETRY_MEASURES)
+    phase = pd.MultiIndex.from_arrays([df["phase"], df["value_type"]])
+    return pd.DataFrame(
+        {
+            "id": df["id"],
+            "parameter": normalize_spirometry_parameter(df["parameter"]),
+            "phase": measures.reindex(phase).to_numpy(),
+            "value": to_numeric(df["value"]),
+        }
+    ).dropna(subset=["phase"])
+
+
+def load_spirometry_manual(file_path):
+    """Load spirometry_manual.csv (one row per parameter, one column per measure)."""
+    import pandas as pd
+
+    df = pd.read_csv(file_path, dtype=str).dropna(how="all")
+    df = df.drop(columns=[c for c in df.columns if c.lower() == "obs"])
+    df.columns = (
+        df.columns.str.lower()
+        .str.replace("-", "_", regex=False)
+        .str.replace("bd", "", regex=False)
+        .str.replace("%", "pct_", regex=False)
+        .str.replace("teòric", "pred", regex=False)
+        .str.replace("_raw", "", regex=False)
+    )
+    long = df.melt(id_vars=["id", "parameter"], var_name="phase", value_name="value")
+    long["parameter"] = normalize_spirometry_parameter(long["parameter"])
+    long["value"] = to_numeric(long["value"])
+    return long[KEY + ["value"]]
+
+
+def reconcile(auto, manual, abs_tol=0.01, rel_tol=0.01):
+    """
+    Join automatic and manual values on (id, parameter, phase) and classify them.
+
+    Status values:
+        match            both values agree within tolerance
+        mismatch         both present, difference beyond tolerance
+        missing_auto     key only entered manually
+        missing_manual   key only extracted automatically
+        missing_value    key on both sides, but one value is empty or not numeric
+
+    Parameters that are never entered manually are left out.
+
+    Returns:
+        pd.DataFrame: One row per key with auto, manual, difference and status.
+    """
+    import numpy as np
+    import pandas as pd
+
+    auto = auto.drop_duplicates(KEY, keep="last").set_index(KEY)["value"]
+    manual = manual.drop_duplicates(KEY, keep="last").set_index(KEY)["value"]
+    covered = auto.index.droplevel("id").isin(manual.index.droplevel("id"))
+    auto = auto[covered]
+    both = pd.concat({"auto": auto, "manual": manual}, axis=1, join="outer")
+
+    in_auto = both.index.isin(auto.index)
+    in_manual = both.index.isin(manual.index)
+    a, m = both["auto"].to_numpy(), both["manual"].to_numpy()
+    difference = a - m
+    within = np.abs(difference) <= abs_tol + rel_tol * np.abs(m)
+
+    both["difference"] = difference
+    both["status"] = np.select(
+        [
+            ~in_auto,
+            ~in_manual,
+            np.isnan(a) | np.isnan(m),
+            within,
+        ],
+        ["missing_auto", "missing_manual", "missing_value", "match"],
+        default="mismatch",
+    )
+    return both.reset_index()
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    import pandas as pd
+
+    auto_dir = os.path.join(args.raw_path, "automatic_extraction")
+    manual_dir = os.path.join(args.raw_path, "manual_entry")
+    if not os.path.isdir(auto_dir) or not os.path.isdir(manual_dir):
+        print(
+            f"❌ Error: '{args.raw_path}' must contain automatic_extraction/ and manual_entry/."
+        )
+        sys.exit(1)
+
+    results = []
+
+    blood_auto = glob.glob(os.path.join(auto_dir, "blood_analysis", "hematology", "*.csv"))
+    blood_manual = glob.glob(os.path.join(manual_dir, "blood_analysis", "*.csv"))
+    if blood_auto and blood_manual:
+        blood = reconcile(
+            load_blood_auto(blood_auto),
+            load_blood_manual(blood_manual),
+            args.abs_tol,
+            args.rel_tol,
+        )
+        results.append(blood.assign(source="blood"))
+    else:
+        print("⚠️ Blood analysis: automatic or manual files not found, skipping.")
+
+    spiro_auto = os.path.join(auto_dir, "spirometry", "spirometry_auto.csv")
+    spiro_manual = os.path.join(manual_dir, "spirometry", "spirometry_manual.csv")
+    if os.path.isfile(spiro_auto) and os.path.isfile(spiro_manual):
+        spirometry = reconcile(
+            load_spirometry_auto(spiro_auto),
+            load_spirometry_manual(spiro_manual),
+            args.abs_tol,
+            args.rel_tol,
+        )
+        results.append(spirometry.assign(source="spirometry"))
+    else:
+        print("⚠️ Spirometry: automatic or manual file not found, skipping.")
+
+    if not results:
+        print("❌ Nothing to reconcile.")
+        sys.exit(1)
+
+    table = pd.concat(results, ignore_index=True)
+    summary = table.groupby(["source", "status"]).size().unstack(fill_value=0)
+    print("\n------------------ Reconciliation ------------------")
+    print(summary.to_string())
+
+    # Only the discrepancies are written
+    discrepancies = table[table["status"] != "match"]
+    discrepancies[["source"] + KEY + ["auto", "manual", "difference", "status"]].to_csv(
+        args.output_file, index=False
+    )
+    print(f"\n✅ {len(discrepancies)} discrepancies saved to {args.output_file}")
+
+    if args.fail_on_mismatch and (table["status"] == "mismatch").any():
+        print("❌ Values differ beyond tolerance.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
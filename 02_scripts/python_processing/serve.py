@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Local HTTP/JSON query service over the extracted study data.
+
+    breathe.py serve <data_root> [--port 8765]
+
+Endpoints (GET, JSON responses):
+    /                        endpoints and cache statistics
+    /tables                  served tables with their row, patient and column counts
+                             (and rows skipped as malformed)
+    /patients/<id>           all records of a patient, by table
+    /parameters/<name>       records of a parameter (or allergen, or MACRO question)
+    /cohort?id=..&id=..      records of a set of patients, by table
+
+/patients, /parameters and /cohort accept `table=` (repeatable) to restrict
+the tables. /parameters and /cohort accept `id=` (repeatable). /cohort also
+accepts `parameter=` with `min=`/`max=` to select the patients with a value
+in range.
+
+Each output file is loaded once, with indexes by id and by parameter, and
+answers are kept in an LRU cache. The modification time and size of the
+files are part of both cache keys, so a rewritten output is reloaded on the
+next request.
+"""
+import os
+import re
+import sys
+import glob
+import csv
+import json
+import argparse
+import traceback
+from functools import lru_cache
+from collections import namedtuple
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Output files served, relative to the data root, and the prefix of their
+# table name (the file name without ".csv" and "_auto"). Subdirectories are
+# listed by name, so shard_i_of_N/ outputs left by `merge` are not served.
+SOURCES = [
+    ("automatic_extraction/blood_analysis/*_auto.csv", ""),
+    ("automatic_extraction/blood_analysis/hematology/*_auto.csv", ""),
+    ("automatic_extraction/blood_analysis/immunology/*_auto.csv", ""),
+    ("automatic_extraction/spirometry/*_auto.csv", ""),
+    ("macro_download/processed/*.csv", "macro_"),
+]
+
+# Column naming what a row measures, the first one present in the table
+PARAMETER_COLUMNS = ["parameter", "allergen", "question"]
+
+ENDPOINTS = ["/tables", "/patients/<id>", "/parameters/<name>", "/cohort"]
+
+# Files not served because an earlier file has the same table name (warned once)
+_shadowed = set()
+
+Table = namedtuple("Table", ["columns", "rows", "by_id", "by_parameter", "skipped"])
+
+
+def parse_arguments(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Serve the extracted blood, spirometry and MACRO outputs as JSON."
+    )
+    parser.add_argument(
+        "data_root",
+        help="Data root containing automatic_extraction/ and macro_download/.",
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)."
+    )
+    parser.add_argument(
+        "--port", type=int, default=8765, help="Port to listen on (default: 8765)."
+    )
+    return parser.parse_args(argv)
+
+
+def find_tables(data_root):
+    """
+    Return the served tables as a sorted tuple of (table, path, mtime_ns, size).
+
+    The result changes whenever an output is added, removed or rewritten,
+    which is what invalidates the caches. When two files give the same table
+    name, the first one in SOURCES order (then by path) is served.
+    """
+    tables = {}
+    for pattern, prefix in SOURCES:
+        for path in sorted(glob.glob(os.path.join(data_root, pattern))):
+            name = os.path.basename(path)[: -len(".csv")]
+            name = prefix + (name[: -len("_auto")] if name.endswith("_auto") else name)
+            if name in tables:
+                if path not in _shadowed:
+                    _shadowed.add(path)
+                    print(f"⚠️ Not serving {path}: table '{name}' is {tables[name][0]}")
+                continue
+            stat = os.stat(path)
+            tables[name] = (path, stat.st_mtime_ns, stat.st_size)
+    return tuple((name, *tables[name]) for name in sorted(tables))
+
+
+@lru_cache(maxsize=64)
+def load_table(path, mtime_ns, size):
+    """
+    Load an output CSV with its indexes by id and by parameter.
+
+    Rows with fewer or more fields than the header (e.g. one cut short while
+    the file was written by hand) are left out and counted in `skipped`.
+
+    Cached per (path, mtime_ns, size): a changed file gets a new entry and
+    the old one ages out of the cache.
+    """
+    rows, skipped = [], 0
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if None in row or None in row.values():
+                skipped += 1
+                continue
+            rows.append(row)
+        columns = reader.fieldnames or []
+    parameter = next((c for c in PARAMETER_COLUMNS if c in columns), None)
+    by_id, by_parameter = {}, {}
+    for row in rows:
+        by_id.setdefault(row.get("id"), []).append(row)
+        if parameter:
+            by_parameter.setdefault((row.get(parameter) or "").strip(), []).append(row)
+    return Table(columns, rows, by_id, by_parameter, skipped)
+
+
+def parse_value(value):
+    """Parse a report value such as '<0.35', '12,5' or '7.1/A' (None if not numeric)."""
+    try:
+        return float(re.sub(r"/[AB]|[<>]", "", value or "").replace(",", ".").strip())
+    except ValueError:
+        return None
+
+
+def _select(tables, names):
+    """Return the (table, Table) pairs of the requested table names (all if empty)."""
+    return [
+        (name, load_table(path, mtime_ns, size))
+        for name, path, mtime_ns, size in tables
+        if not names or name in names
+    ]
+
+
+def query_tables(tables):
+    return {
+        name: {
+            "rows": len(table.rows),
+            "patients": len(table.by_id),
+            "columns": table.columns,
+            "skipped": table.skipped,
+        }
+        for name, table in _select(tables, None)
+    }
+
+
+def query_patient(tables, study_id, names):
+    records = {
+        name: table.by_id[study_id]
+        for name, table in _select(tables, names)
+        if study_id in table.by_id
+    }
+    if not records:
+        raise LookupError(f"No records for patient '{study_id}'")
+    return {"id": study_id, "tables": records}
+
+
+def query_parameter(tables, parameter, names, ids):
+    rows = [
+        dict(row, table=name)
+        for name, table in _select(tables, names)
+        for row in table.by_parameter.get(parameter, [])
+        if not ids or row.get("id") in ids
+    ]
+    if not rows:
+        raise LookupError(f"No records for parameter '{parameter}'")
+    return {"parameter": parameter, "rows": rows}
+
+
+def query_cohort(tables, names, ids, parameter, low, high):
+    selected = _select(tables, names)
+    if parameter:
+        # Patients with a value of the parameter within [low, high]
+        matching = set()
+        for _, table in selected:
+            for row in table.by_parameter.get(parameter, []):
+                value = parse_value(row.get("value"))
+                if value is not None and (low is None or value >= low) and (
+                    high is None or value <= high
+                ):
+                    matching.add(row.get("id"))
+        ids = matching & ids if ids else matching
+    if not ids:
+        raise LookupError("No patients match the cohort filters")
+    records = {
+        name: [row for study_id in sorted(ids) for row in table.by_id.get(study_id, [])]
+        for name, table in selected
+    }
+    return {
+        "ids": sorted(ids),
+        "tables": {name: rows for name, rows in records.items() if rows},
+    }
+
+
+def _float(params, name):
+    """Return a numeric query parameter (None if absent)."""
+    if name not in params:
+        return None
+    try:
+        return float(params[name][-1])
+    except ValueError:
+        raise ValueError(f"'{name}' must be a number")
+
+
+@lru_cache(maxsize=256)
+def answer(tables, path, query):
+    """
+    Return the JSON body answering a request.
+
+    Cached per (tables, path, query); `tables` comes from find_tables(), so
+    answers computed before an output changed are never served again.
+
+    Raises:
+        LookupError: Unknown endpoint or nothing matches (404).
+        ValueError: Invalid query parameters (400).
+    """
+    params = parse_qs(query)
+    names = frozenset(params.get("table", []))
+    ids = frozenset(params.get("id", []))
+    parts = [unquote(part) for part in path.strip("/").split("/") if part]
+
+    if parts == ["tables"]:
+        result = query_tables(tables)
+    elif len(parts) == 2 and parts[0] == "patients":
+        result = query_patient(tables, parts[1], names)
+    elif len(parts) == 2 and parts[0] == "parameters":
+        result = query_parameter(tables, parts[1], names, ids)
+    elif parts == ["cohort"]:
+        parameter = params.get("parameter", [None])[-1]
+        result = query_cohort(
+            tables, names, ids, parameter, _float(params, "min"), _float(params, "max")
+        )
+    else:
+        raise LookupError(f"Unknown endpoint '{path}'")
+    return json.dumps(result, ensure_ascii=False).encode("utf-8")
+
+
+def cache_info():
+    """Return the hit and miss counts of the answer and table caches."""
+    return {
+        name: {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+        for name, info in (
+            ("answers", answer.cache_info()),
+            ("tables", load_table.cache_info()),
+        )
+    }
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answer GET requests with JSON from the outputs under `server.data_root`."""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            tables = find_tables(self.server.data_root)
+            if url.path.strip("/"):
+                body, status = answer(tables, url.path, url.query), 200
+            else:
+                # Not cached, so the statistics are current
+                index = {"endpoints": ENDPOINTS, "cache": cache_info()}
+                body, status = json.dumps(index).encode("utf-8"), 200
+        except LookupError as e:
+            body, status = json.dumps({"error": str(e)}).encode("utf-8"), 404
+        except ValueError as e:
+            body, status = json.dumps({"error": str(e)}).encode("utf-8"), 400
+        except Exception as e:
+            # Any other failure still gets an answer; the server keeps serving
+            traceback.print_exc()
+            error = {"error": f"Internal error: {type(e).__name__}: {e}"}
+            body, status = json.dumps(error).encode("utf-8"), 500
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    if not os.path.isdir(args.data_root):
+        print(f"❌ Error: Data root '{args.data_root}' does not exist.")
+        sys.exit(1)
+    tables = find_tables(args.data_root)
+    if not tables:
+        print(f"⚠️ No outputs found under {args.data_root} yet.")
+    print(f"📁 Serving {len(tables)} tables from {args.data_root}")
+
+    server = ThreadingHTTPServer((args.host, args.port), QueryHandler)
+    server.data_root = args.data_root
+    print(f"🌐 Listening on http://{args.host}:{args.port}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️ Stopped.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Split an extraction across machines and merge the results.
+
+Each node runs an extractor with `--shard i/N` on the shared input
+directory. It only takes the files whose name hashes to shard i, and it
+writes to its own `shard_i_of_N/` subdirectory of the output directory.
+`breathe.py merge <output_dir>` then combines the shard outputs into the
+canonical CSV files.
+"""
+import os
+import sys
+import glob
+import sqlite3
+import hashlib
+import argparse
+from provenance import PROVENANCE_FILE, create_schema
+from checkpoint import CHECKPOINT_DIR, PROCESSED_FILE
+from upsert import UPSERTED_FILE
+
+SHARD_PREFIX = "shard_"
+
+
+def parse_shard(value):
+    """Parse "i/N" (1 <= i <= N) into (i, N); used as an argparse type."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got '{value}'")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 1..{count}")
+    return index, count
+
+
+def add_shard_arguments(parser):
+    """Add the shared --shard option to an extractor's argument parser."""
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="i/N",
+        help="Only process shard i of N (by file name hash), into output_dir/shard_i_of_N/.",
+    )
+
+
+def in_shard(filename, shard):
+    """Return True if the file belongs to the shard (always True without sharding)."""
+    if shard is None:
+        return True
+    index, count = shard
+    digest = hashlib.sha1(os.path.basename(filename).encode("utf-8")).hexdigest()
+    return int(digest, 16) % count == index - 1
+
+
+def shard_output_dir(output_dir, shard):
+    """Return the output directory of a shard."""
+    index, count = shard
+    return os.path.join(output_dir, f"{SHARD_PREFIX}{index}_of_{count}")
+
+
+def parse_arguments(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Merge the shard outputs of an extractor into the canonical CSV files."
+    )
+    parser.add_argument(
+        "output_dir", help="Output directory holding the shard_i_of_N/ subdirectories."
+    )
+    parser.add_argument(
+        "--allow-partial",
+        action="store_true",
+        help="Merge even if some shards of the run are missing.",
+    )
+    parser.add_argument(
+        "--drop-duplicates",
+        action="store_true",
+        help="Drop repeated identical rows (e.g. a file processed by two shards).",
+    )
+    return parser.parse_args(argv)
+
+
+def find_shards(output_dir):
+    """
+    Return the shard directories of the output directory, sorted by index.
+
+    Raises:
+        ValueError: If the directories belong to runs with different N.
+    """
+    shards = {}
+    for path in glob.glob(os.path.join(output_dir, f"{SHARD_PREFIX}*_of_*")):
+        name = os.path.basename(path)[len(SHARD_PREFIX) :]
+        index, count = (int(part) for part in name.split("_of_"))
+        shards[(index, count)] = path
+    if len({count for _, count in shards}) > 1:
+        raise ValueError(f"Shards of runs with different N in '{output_dir}'")
+    return [shards[key] for key in sorted(shards)]
+
+
+def shard_csv_files(shard_dir):
+    """Return the output CSV files of a shard, relative to the shard directory."""
+    files = []
+    for root, dirs, names in os.walk(shard_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        files.extend(
+            os.path.relpath(os.path.join(root, name), shard_dir)
+            for name in names
+            if name.endswith(".csv")
+        )
+    return files
+
+
+def processed_by_shards(shard_dirs):
+    """
+    Return input file name -> shards that processed it (from the checkpoints).
+
+    Both the files flushed by a full run (processed.txt) and those upserted
+    with --upsert (upserted.txt, name then size and mtime) are counted.
+    """
+    processed = {}
+    for shard_dir in shard_dirs:
+        names = set()
+        for checkpoint_file in (PROCESSED_FILE, UPSERTED_FILE):
+            path = os.path.join(shard_dir, CHECKPOINT_DIR, checkpoint_file)
+            if not os.path.isfile(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                names.update(line.rstrip("\n").split("\t")[0] for line in f)
+        for name in sorted(names):
+            processed.setdefault(name, []).append(os.path.basename(shard_dir))
+    return processed
+
+
+def merge_csv(shard_paths, output_path, drop_duplicates=False):
+    """
+    Concatenate shard CSV files into one, sorted by all columns so the
+    result does not depend on how files were spread over the shards. The
+    output is replaced in a single rename.
+
+    Returns:
+        tuple: (rows written, repeated identical rows found)
+    """
+    import pandas as pd
+
+    merged = pd.concat(
+        (pd.read_csv(path, dtype=str, keep_default_na=False) for path in shard_paths),
+        ignore_index=True,
+    )
+    merged = merged.sort_values(list(merged.columns), kind="mergesort")
+    duplicated = merged.duplicated()
+    if drop_duplicates:
+        merged = merged[~duplicated]
+
+    tmp_path = f"{output_path}.tmp"
+    merged.to_csv(tmp_path, index=False, lineterminator="\r\n")
+    os.replace(tmp_path, output_path)
+    return len(merged), int(duplicated.sum())
+
+
+def merge_provenance(shard_dirs, output_dir):
+    """Combine the provenance indexes of the shards into the output directory."""
+    sources = [
+        os.path.join(d, PROVENANCE_FILE)
+        for d in shard_dirs
+        if os.path.isfile(os.path.join(d, PROVENANCE_FILE))
+    ]
+    if not sources:
+        return 0
+    tmp_path = os.path.join(output_dir, f"{PROVENANCE_FILE}.tmp")
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    create_schema(connection)
+    for source in sources:
+        connection.execute("ATTACH DATABASE ? AS shard", (source,))
+        connection.execute("INSERT INTO provenance SELECT * FROM shard.provenance")
+        connection.commit()
+        connection.execute("DETACH DATABASE shard")
+    n_records = connection.execute("SELECT COUNT(*) FROM provenance").fetchone()[0]
+    connection.close()
+    os.replace(tmp_path, os.path.join(output_dir, PROVENANCE_FILE))
+    return n_records
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    if not os.path.isdir(args.output_dir):
+        print(f"❌ Error: Output directory '{args.output_dir}' does not exist.")
+        sys.exit(1)
+    try:
+        shard_dirs = find_shards(args.output_dir)
+    except ValueError as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    if not shard_dirs:
+        print(f"❌ No shard directories found in {args.output_dir}")
+        sys.exit(1)
+
+    count = int(os.path.basename(shard_dirs[0]).rsplit("_of_", 1)[1])
+    print(f"📁 Merging {len(shard_dirs)} of {count} shards in {args.output_dir}")
+    if len(shard_dirs) < count and not args.allow_partial:
+        print("❌ Error: Some shards are missing (use --allow-partial to merge anyway).")
+        sys.exit(1)
+
+    # Input files processed by more than one shard (e.g. runs with a different N)
+    overlaps = {
+        name: shards
+        for name, shards in processed_by_shards(shard_dirs).items()
+        if len(shards) > 1
+    }
+    for name, shards in sorted(overlaps.items()):
+        print(f"⚠️ {name} was processed by {', '.join(shards)}")
+
+    relative_paths = sorted({p for d in shard_dirs for p in shard_csv_files(d)})
+    for relative_path in relative_paths:
+        shard_paths = [
+            os.path.join(d, relative_path)
+            for d in shard_dirs
+            if os.path.isfile(os.path.join(d, relative_path))
+        ]
+        output_path = os.path.join(args.output_dir, relative_path)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        n_rows, n_duplicates = merge_csv(shard_paths, output_path, args.drop_duplicates)
+        message = f"✅ {relative_path}: {n_rows} rows"
+        if n_duplicates:
+            action = "dropped" if args.drop_duplicates else "kept"
+            message += f" (⚠️ {n_duplicates} duplicate rows {action})"
+        print(message)
+
+    n_records = merge_provenance(shard_dirs, args.output_dir)
+    if n_records:
+        print(f"✅ {PROVENANCE_FILE}: {n_records} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import sys
+
+import pytest
+
+# The processing scripts import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """Return a function writing a PDF with the given lines on each page."""
+    import fitz
+
+    def make(name, pages):
+        doc = fitz.open()
+        for lines in pages:
+            page = doc.new_page()
+            for i, line in enumerate(lines):
+                page.insert_text((30, 50 + 14 * i), line, fontsize=8, fontname="cour")
+        path = str(tmp_path / name)
+        doc.save(path)
+        doc.close()
+        return path
+
+    return make
+
+
+# Laboratory table of the blood report written by make_blood_pdf
+BLOOD_ROWS = [
+    ("Prestació", "Resultat", "Unitat", ""),
+    ("HEMOGRAMA", "", "", ""),
+    ("Leucòcits", "7.5", "x10^9/L", "4-11"),
+    ("Hemoglobina", "140", "g/L", "120-160"),
+    ("RECOMPTE DIFERENCIAL AUTOMÀTIC", "", "", ""),
+    ("Eosinòfils", "0.45", "x10^9/L", "0-0.5"),
+    ("AL·LÈRGENS ESPECÍFICS", "", "", ""),
+    ("IGE total", "250", "kU/L", "<100"),
+    ("AL·LÈRGIA ÀCARS", "", "", ""),
+    ("D. pteronyssinus IgE", "12.3", "kUA/L", "<0.35"),
+    ("AL·LÈRGENS RECOMBINANTS", "", "", ""),
+    ("Der p 1 IgE", "5.1", "kUA/L", "<0.35"),
+]
+
+
+@pytest.fixture
+def make_blood_pdf(tmp_path):
+    """Return a function writing a one-page blood report in the HCB layout."""
+    import fitz
+
+    def make(name, nhc="0012345", reception_label="Data recepció mostra"):
+        doc = fitz.open()
+        page = doc.new_page()
+        font, bold = fitz.Font("helv"), fitz.Font("hebo")
+        writer = fitz.TextWriter(page.rect)
+        writer.append((30, 40), "LABORATORI CORE", font=font, fontsize=9)
+        writer.append((30, 70), "PACIENT PROVA", font=font, fontsize=9)
+        writer.append((30, 82), f"NHC: {nhc}", font=font, fontsize=9)
+        writer.append((300, 70), f" {reception_label}: 10/01/2024, 08:30", font=font, fontsize=9)
+        writer.append((300, 82), "Data naix.: 05/06/1970", font=font, fontsize=9)
+        xs, top, height = [30, 250, 377, 470, 560], 300, 18
+        for i, row in enumerate(BLOOD_ROWS):
+            for j, cell in enumerate(row):
+                if cell:
+                    cell_font = bold if j == 1 and "IgE" in row[0] else font
+                    writer.append((xs[j] + 2, top + i * height + 12), cell, font=cell_font, fontsize=8)
+        writer.write_text(page)
+        for i in range(len(BLOOD_ROWS) + 1):
+            page.draw_line((30, top + i * height), (560, top + i * height))
+        for x in xs:
+            page.draw_line((x, top), (x, top + len(BLOOD_ROWS) * height))
+        path = str(tmp_path / name)
+        doc.save(path)
+        doc.close()
+        return path
+
+    return make
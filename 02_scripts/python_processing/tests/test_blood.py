@@ -0,0 +1,28 @@
+import prefetch
+from process_blood_analysis import process_pdf
+
+NHC_TO_ID = {"12345": "HCB001"}
+
+
+def test_report_matching_no_template_is_still_extracted(make_blood_pdf, capsys):
+    path = make_blood_pdf("unknown.pdf", reception_label="Data de recepció")
+
+    rows = process_pdf(path, NHC_TO_ID)
+
+    assert "using 'hcb_blood'" in capsys.readouterr().out
+    assert rows["haemogram"].column("parameter") == ["Leucòcits", "Hemoglobina"]
+    assert rows["ige_recombinant"].column("allergen") == ["Der p 1 IgE"]
+    assert rows["metadata"].column("sample_reception_date") == ["NA"]
+
+
+def test_report_is_opened_once(make_blood_pdf, monkeypatch):
+    path = make_blood_pdf("report.pdf")
+    opened = []
+    open_pdf = prefetch.open_pdf
+    monkeypatch.setattr(prefetch, "open_pdf", lambda source: opened.append(source) or open_pdf(source))
+
+    rows = process_pdf(path, NHC_TO_ID)
+
+    assert opened == [path]
+    assert rows["metadata"].column("id") == ["HCB001"]
+    assert rows["ige_total"].column("value") == ["250"]
@@ -0,0 +1,79 @@
+import csv
+import io
+import os
+
+import pytest
+
+from checkpoint import CheckpointedWriter, parquet_dir
+from columnar import ColumnarTable
+
+COLUMNS = ["id", "parameter", "value", "page", "x0"]
+
+
+def table(*rows):
+    t = ColumnarTable(COLUMNS, {"id", "parameter"}, {"page": "i", "x0": "d"})
+    for row in rows:
+        t.append_values(row)
+    return t
+
+
+def test_rows_read_back_as_appended():
+    t = table(("A", "FVC", "6.1", 0, 10.5), ("A", "FEV1", None, None, None))
+
+    assert len(t) == 2
+    assert list(t) == [
+        {"id": "A", "parameter": "FVC", "value": "6.1", "page": 0, "x0": 10.5},
+        {"id": "A", "parameter": "FEV1", "value": None, "page": None, "x0": None},
+    ]
+    f = io.StringIO()
+    t.write_csv(f, ["id", "value", "page"])
+    assert f.getvalue() == "A,6.1,0\r\nA,,\r\n"
+
+
+def test_fill_take_and_extend_by_column_name():
+    t = table((None, "FVC", "6.1", 0, 1.0), (None, "FEV1", "4.2", 1, 2.0))
+    t.fill("id", "HCB001")
+
+    assert t.take([1]).column("parameter") == ["FEV1"]
+    buffer = t.empty_like(["id", "value"])
+    buffer.extend(t)
+    buffer.extend([{"id": "HCB002", "value": "1"}])
+    assert buffer.column("id") == ["HCB001", "HCB001", "HCB002"]
+    assert buffer.column("value") == ["6.1", "4.2", "1"]
+
+
+def test_to_arrow_keeps_encodings_and_nulls():
+    pa = pytest.importorskip("pyarrow")
+    arrow = table(("A", "FVC", "6.1", 0, 1.5), (None, "FVC", None, None, None)).to_arrow()
+
+    assert pa.types.is_dictionary(arrow.schema.field("id").type)
+    assert arrow.schema.field("page").type == pa.int32()
+    assert arrow.schema.field("x0").type == pa.float64()
+    assert arrow.to_pydict() == {
+        "id": ["A", None],
+        "parameter": ["FVC", "FVC"],
+        "value": ["6.1", None],
+        "page": [0, None],
+        "x0": [1.5, None],
+    }
+
+
+def test_parquet_parts_are_rolled_back_on_resume(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "out.csv")
+    tables = {"t": (path, ["id", "parameter", "value"])}
+
+    writer = CheckpointedWriter(tables, str(tmp_path), chunk_size=1, parquet=True)
+    writer.add("a.pdf", {"t": table(("A", "FVC", "6.1", 0, 1.0))})
+    # A part written by a flush that did not reach the checkpoint
+    stale = os.path.join(parquet_dir(path), "part-00001.parquet")
+    pq.write_table(table(("X", "FVC", "0", 0, 0.0)).to_arrow(), stale)
+
+    writer = CheckpointedWriter(tables, str(tmp_path), chunk_size=1, resume=True)
+    assert not os.path.exists(stale)
+    writer.add("b.pdf", {"t": table(("B", "FVC", "5.0", 0, 1.0))})
+
+    dataset = pq.read_table(parquet_dir(path)).to_pydict()
+    assert sorted(dataset["id"]) == ["A", "B"]
+    with open(path, newline="", encoding="utf-8") as f:
+        assert [row["id"] for row in csv.DictReader(f)] == ["A", "B"]
@@ -0,0 +1,35 @@
+import pytest
+
+from posology import Posology, parse_posology
+
+CASES = [
+    # text, dose, dose_unit, freq_per_day, route, as_needed
+    ("2 INH / C/12H / PULMONAR (SEGONS EVOLUCIÓ)", 2.0, "INH", 2.0, "PULMONAR", False),
+    ("10 MG / C/24H / ORAL (SEGONS EVOLUCIÓ)", 10.0, "MG", 1.0, "ORAL", False),
+    ("1-0-1", 1.0, None, 2.0, None, False),
+    ("cada 12 h", None, None, 2.0, None, False),
+    ("2 inh/12h", 2.0, "INH", 2.0, None, False),
+    ("1 comp si precisa", 1.0, "COMP", None, None, True),
+    # Clock times are not a dose
+    ("08:00 20:00", None, None, 2.0, None, False),
+    ("08:00", None, None, 1.0, None, False),
+    # Fractional doses
+    ("1/2 COMP C/24H", 0.5, "COMP", 1.0, None, False),
+    # Only known units; "al dia" is daily
+    ("1 vez al dia", None, None, 1.0, None, False),
+    ("1 VEGADA AL DIA", None, None, 1.0, None, False),
+    ("2 veces al dia", None, None, 2.0, None, False),
+    ("1 comp al dia", 1.0, "COMP", 1.0, None, False),
+    # A treatment duration alone is daily, as in 05_process_treatment_data.R
+    ("365 DIES", None, None, 1.0, None, False),
+    ("1 DIES", None, None, 1.0, None, False),
+    # Zero denominators and intervals are unreadable, not errors
+    ("1/0 COMP", None, "COMP", None, None, False),
+    ("0 / 0", None, None, None, None, False),
+    ("1 COMP C/0H", 1.0, "COMP", None, None, False),
+]
+
+
+@pytest.mark.parametrize("text, dose, unit, freq, route, as_needed", CASES)
+def test_parse_posology(text, dose, unit, freq, route, as_needed):
+    assert parse_posology(text) == Posology(dose, unit, freq, route, as_needed)
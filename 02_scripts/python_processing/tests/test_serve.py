@@ -0,0 +1,74 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import serve
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Serve a data root with a spirometry output that has a short row."""
+    output_dir = tmp_path / "automatic_extraction" / "spirometry"
+    output_dir.mkdir(parents=True)
+    (output_dir / "spirometry_auto.csv").write_text(
+        "id,parameter,value\r\nHCB001,FVC,3.1\r\nHCB002\r\nHCB003,FEV1,2.4\r\n"
+    )
+    httpd = serve.ThreadingHTTPServer(("127.0.0.1", 0), serve.QueryHandler)
+    httpd.data_root = str(tmp_path)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_short_rows_are_skipped_and_counted(server):
+    status, tables = get(f"{server}/tables")
+    assert status == 200
+    assert tables["spirometry"]["rows"] == 2
+    assert tables["spirometry"]["skipped"] == 1
+
+    status, body = get(f"{server}/parameters/FEV1")
+    assert status == 200
+    assert [row["id"] for row in body["rows"]] == ["HCB003"]
+
+
+def test_unexpected_error_is_answered_with_json(server, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(serve, "answer", fail)
+    status, body = get(f"{server}/tables")
+    assert status == 500
+    assert "boom" in body["error"]
+
+    monkeypatch.undo()
+    assert get(f"{server}/tables")[0] == 200
+
+
+def test_shard_outputs_and_duplicate_names_are_not_served(tmp_path, capsys):
+    blood = tmp_path / "automatic_extraction" / "blood_analysis"
+    for directory in ("", "shard_1_of_2", "hematology", "immunology"):
+        (blood / directory).mkdir(parents=True, exist_ok=True)
+    (blood / "metadata_auto.csv").write_text("id\r\nHCB001\r\n")
+    (blood / "shard_1_of_2" / "metadata_auto.csv").write_text("id\r\nHCB001\r\n")
+    (blood / "hematology" / "hemograma_auto.csv").write_text("id\r\nHCB001\r\n")
+    (blood / "immunology" / "hemograma_auto.csv").write_text("id\r\nHCB001\r\n")
+
+    tables = {name: path for name, path, _, _ in serve.find_tables(str(tmp_path))}
+
+    assert tables == {
+        "metadata": str(blood / "metadata_auto.csv"),
+        "hemograma": str(blood / "hematology" / "hemograma_auto.csv"),
+    }
+    assert "Not serving" in capsys.readouterr().out
@@ -0,0 +1,20 @@
+from shard import processed_by_shards
+
+
+def test_processed_by_shards_reads_both_checkpoints(tmp_path):
+    full, upserted = tmp_path / "shard_1_of_2", tmp_path / "shard_2_of_2"
+    (full / ".checkpoint").mkdir(parents=True)
+    (upserted / ".checkpoint").mkdir(parents=True)
+    (full / ".checkpoint" / "processed.txt").write_text("a.pdf\nb.pdf\n")
+    # A file upserted again after it changed is listed twice
+    (upserted / ".checkpoint" / "upserted.txt").write_text(
+        "a.pdf\t100\t1\nc.pdf\t100\t1\nc.pdf\t120\t2\n"
+    )
+
+    processed = processed_by_shards([str(full), str(upserted)])
+
+    assert processed == {
+        "a.pdf": ["shard_1_of_2", "shard_2_of_2"],
+        "b.pdf": ["shard_1_of_2"],
+        "c.pdf": ["shard_2_of_2"],
+    }
@@ -0,0 +1,86 @@
+from process_spirometry import extract_spirometry_report
+
+PAGE_HEADER = [
+    "HOSPITAL CLINIC DE BARCELONA",
+    "NHC : 0012345        Edat: 45 anys",
+    "Data exploració: 01/02/2024",
+]
+
+SPIROMETRY = [
+    "ESPIROMETRIA FORÇADA",
+    "                Pre      Teòric    LIN      %Teòric   Z-Score",
+    "FVC(L)          3.50     4.00      3.20     87        -1.00",
+    "FEV1(L)         2.50     3.20      2.60     78        -1.50",
+]
+
+HISTORY_HEADER = "Data          FVC(L)   FEV1(L)   FEV1/FVC(%)"
+
+
+def history_values(report):
+    return {(row["date"], row["parameter"]): row["value"] for row in report["history"]}
+
+
+def test_history_continues_after_page_header(make_pdf):
+    path = make_pdf(
+        "history.pdf",
+        [
+            PAGE_HEADER
+            + SPIROMETRY
+            + ["HISTÒRIC", HISTORY_HEADER, "01/02/2022    3.60     2.60      72"],
+            PAGE_HEADER
+            + [
+                "01/02/2021    3.65     2.65      ----",
+                "01/02/2020    3.70     2.70      73",
+            ],
+        ],
+    )
+
+    values = history_values(extract_spirometry_report(path))
+
+    assert sorted({date for date, _ in values}) == ["01/02/2020", "01/02/2021", "01/02/2022"]
+    assert values[("01/02/2021", "FEV1(L)")] == "2.65"
+    assert ("01/02/2021", "FEV1/FVC(%)") not in values
+    assert values[("01/02/2020", "FEV1/FVC(%)")] == "73"
+
+
+def test_history_header_repeated_on_next_page(make_pdf):
+    path = make_pdf(
+        "history_repeated.pdf",
+        [
+            PAGE_HEADER
+            + SPIROMETRY
+            + ["HISTÒRIC", HISTORY_HEADER, "01/02/2022    3.60     2.60      72"],
+            PAGE_HEADER + [HISTORY_HEADER, "01/02/2021    3.65     2.65      71"],
+        ],
+    )
+
+    values = history_values(extract_spirometry_report(path))
+
+    assert sorted({date for date, _ in values}) == ["01/02/2021", "01/02/2022"]
+    assert len(values) == 6
+
+
+def test_measurements_keep_pre_values_with_postbd_columns(make_pdf):
+    path = make_pdf(
+        "postbd.pdf",
+        [
+            PAGE_HEADER
+            + SPIROMETRY
+            + [
+                "VOLUMS PULMONARS",
+                "                Pre      Teòric    LIN      %Teòric   Z-Score   PostBD   %Teòric   Z-Score",
+                "TLC(L)          6.10     6.00      5.00     101       0.20      6.30     105       0.40",
+                "DIFUSIÓ",
+                "                Pre      Teòric    LIN      %Teòric   Z-Score",
+                "DLCO(mL/min/mmHg)  22.1  25.0      19.0     88        -0.80",
+            ]
+        ],
+    )
+
+    report = extract_spirometry_report(path)
+    (tlc,) = report["lung_volumes"]
+    (dlco,) = report["diffusion"]
+
+    assert (tlc["value"], tlc["theorical"], tlc["lin"]) == (6.10, 6.00, 5.00)
+    assert (tlc["pct_theorical"], tlc["z_score"]) == (101, 0.20)
+    assert (dlco["pct_theorical"], dlco["z_score"]) == (88, -0.80)
@@ -0,0 +1,87 @@
+import os
+import csv
+
+import pytest
+
+from upsert import KeyIndex, KeyedWriter, oldest_first, upsert_csv
+
+FIELDS = ["id", "parameter", "value"]
+KEY = ["id", "parameter"]
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def rows(*values):
+    return [dict(zip(FIELDS, v)) for v in values]
+
+
+def test_new_keys_are_appended_in_place(tmp_path):
+    path = str(tmp_path / "out.csv")
+    index = KeyIndex(str(tmp_path))
+    assert upsert_csv(path, FIELDS, KEY, rows(("A", "x", "1")), index, atomic=False) == (1, 0)
+    inode = os.stat(path).st_ino
+
+    assert upsert_csv(path, FIELDS, KEY, rows(("B", "x", "2")), index, atomic=False) == (1, 0)
+    assert upsert_csv(path, FIELDS, KEY, rows(("A", "x", "1")), index, atomic=False) == (0, 0)
+    assert os.stat(path).st_ino == inode
+    assert read_rows(path) == [FIELDS, ["A", "x", "1"], ["B", "x", "2"]]
+
+
+def test_changed_key_is_replaced(tmp_path):
+    path = str(tmp_path / "out.csv")
+    index = KeyIndex(str(tmp_path))
+    upsert_csv(path, FIELDS, KEY, rows(("A", "x", "1"), ("B", "x", "2")), index)
+
+    assert upsert_csv(path, FIELDS, KEY, rows(("A", "x", "9"), ("C", "x", "3")), index) == (1, 1)
+    assert read_rows(path) == [FIELDS, ["A", "x", "9"], ["B", "x", "2"], ["C", "x", "3"]]
+
+
+def test_output_edited_elsewhere_is_reindexed(tmp_path):
+    path = str(tmp_path / "out.csv")
+    index = KeyIndex(str(tmp_path))
+    upsert_csv(path, FIELDS, KEY, rows(("A", "x", "1")), index, atomic=False)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("B,x,2\r\nC,x")  # another row, then one cut short
+
+    assert upsert_csv(path, FIELDS, KEY, rows(("B", "x", "2")), index) == (0, 0)
+    assert upsert_csv(path, FIELDS, KEY, rows(("C", "x", "3")), index) == (1, 0)
+    assert read_rows(path) == [FIELDS, ["A", "x", "1"], ["B", "x", "2"], ["C", "x", "3"]]
+
+
+def test_output_without_key_column_is_not_merged(tmp_path):
+    path = str(tmp_path / "out.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("id,value\r\nA,1\r\n")
+    with pytest.raises(ValueError, match="parameter"):
+        upsert_csv(path, FIELDS, KEY, rows(("A", "x", "1")), KeyIndex(str(tmp_path)))
+
+
+def test_oldest_first(tmp_path):
+    paths = [str(tmp_path / name) for name in ("a.pdf", "b.pdf", "c.pdf")]
+    for path, mtime in zip(paths, (30, 10, 20)):
+        open(path, "w").close()
+        os.utime(path, (mtime, mtime))
+    assert oldest_first(paths) == [paths[1], paths[2], paths[0]]
+
+
+def test_keyed_writer_takes_latest_file_and_reruns_changed_files(tmp_path):
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    output_dir.mkdir()
+    for name in ("r1.pdf", "r2.pdf"):
+        (input_dir / name).write_text(name)
+    path = str(output_dir / "out.csv")
+
+    writer = KeyedWriter({"t": (path, FIELDS)}, {"t": KEY}, str(output_dir), str(input_dir))
+    writer.add("r1.pdf", {"t": rows(("A", "x", "1"), ("A", "y", "1"))})
+    writer.add("r2.pdf", {"t": rows(("A", "x", "2"))})
+    writer.close()
+    assert read_rows(path) == [FIELDS, ["A", "x", "2"], ["A", "y", "1"]]
+
+    writer = KeyedWriter({"t": (path, FIELDS)}, {"t": KEY}, str(output_dir), str(input_dir))
+    assert writer.done(str(input_dir / "r1.pdf"))
+    (input_dir / "r1.pdf").write_text("corrected report")
+    assert not writer.done(str(input_dir / "r1.pdf"))
@@ -4,9 +4,18 @@ import csv
 import sys
 import argparse
 from utils import detect_encoding
+from upsert import KeyIndex, oldest_first, upsert_csv
+from prefetch import add_prefetch_arguments, prefetch, open_text
+from macro_catalog import CATALOG_FILE, parse_site_line, update_catalog, select_exports
+from watch import add_watch_arguments, watch_directory
 
+OUTPUT_HEADER = ["id", "visit", "question", "value", "status"]
+# One output file per form, so (id, visit, form, question) keys a record by
+# (id, visit, question); the answers of each visit are kept
+OUTPUT_KEY = ["id", "visit", "question"]
 
-def parse_arguments():
+
+def parse_arguments(argv=None):
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(description="Process CSV files for each form")
     parser.add_argument(
@@ -24,7 +33,19 @@ def parse_arguments():
         default=[],
         help="Patterns to skip in status column (default: IDSub IDVer)",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--form",
+        nargs="+",
+        help="Only process exports of these forms (e.g. ACQ), looked up in the catalog",
+    )
+    parser.add_argument(
+        "--subject",
+        nargs="+",
+        help="Only process exports of these subjects (e.g. HCB045), looked up in the catalog",
+    )
+    add_watch_arguments(parser)
+    add_prefetch_arguments(parser)
+    return parser.parse_args(argv)
 
 
 def validate_input_dir(input_dir):
@@ -64,8 +85,9 @@ def process_file(input_path, skip_patterns_question, skip_patterns_status):
             return None, None, "Encoding not detected"
         processed_rows = []
         subject_id = None
+        visit = None
         form = None
-        with open(input_path, encoding=encoding, newline="") as infile:
+        with open_text(input_path, encoding) as infile:
             reader = csv.reader(infile, delimiter=",")
             for i, row in enumerate(reader):
                 if i < 2:
@@ -78,11 +100,10 @@ def process_file(input_path, skip_patterns_question, skip_patterns_status):
                 ):
                     continue
                 if question.startswith("Site:"):
-                    subject_id = question.split("/")[1].split(":")[1].strip()
-                    form = question.split("/")[3].split(":")[1].strip()
+                    subject_id, visit, form = parse_site_line(question)
                     continue
                 if subject_id and form:
-                    processed_rows.append([subject_id, question, value, status])
+                    processed_rows.append([subject_id, visit, question, value, status])
         if not form:
             return None, None, "No form detected"
         return form, processed_rows, None
@@ -90,17 +111,44 @@ def process_file(input_path, skip_patterns_question, skip_patterns_status):
         return None, None, str(e)
 
 
-def write_output(output_path, processed_rows):
-    """Write processed rows to output CSV file."""
-    header = ["id", "question", "value", "status"]
-    with open(output_path, "w", encoding="utf-8", newline="") as outfile:
-        writer = csv.writer(outfile)
-        writer.writerow(header)
-        writer.writerows(processed_rows)
+def write_output(output_path, processed_rows, index, atomic=False):
+    """
+    Upsert processed rows into a form's output CSV file.
+
+    Answers of the same subject, visit and question replace the previous
+    ones. New answers are appended; the file is only rewritten (in one
+    rename) when a previous answer changed. `atomic` appends by replacing
+    the file too, for outputs read while being written.
+
+    Returns:
+        tuple: (keys inserted, keys updated)
+
+    Raises:
+        ValueError: If the output was written without a key column.
+    """
+    return upsert_csv(
+        output_path,
+        OUTPUT_HEADER,
+        OUTPUT_KEY,
+        [dict(zip(OUTPUT_HEADER, row)) for row in processed_rows],
+        index,
+        atomic,
+    )
+
+
+def is_subject_export(filename):
+    """Return True for EDC subject exports (SubjectData*.csv)."""
+    return filename.startswith("SubjectData") and filename.endswith(".csv")
+
 
+def form_output_path(output_dir, form):
+    """Return the output path of a form, normalized to lowercase with underscores."""
+    normalized_form = form.lower().replace(" ", "_")
+    return os.path.join(output_dir, f"{normalized_form}.csv")
 
-def main():
-    args = parse_arguments()
+
+def main(argv=None):
+    args = parse_arguments(argv)
     input_dir = args.input_folder
 
     validate_input_dir(input_dir)
@@ -113,13 +161,23 @@ def main():
 
     processed_count = 0
     skipped_count = 0
+    unchanged_count = 0
     errors = []
+    failed_files = set()
 
-    for filename in os.listdir(input_dir):
-        if not filename.startswith("SubjectData") or not filename.endswith(".csv"):
-            continue
-
-        input_path = os.path.join(input_dir, filename)
+    # Subject and form of each export, from the catalog (headers of new files only)
+    catalog = update_catalog(
+        input_dir, os.path.join(output_dir, CATALOG_FILE), is_subject_export
+    )
+    filenames = select_exports(catalog, args.form, args.subject)
+    if args.form or args.subject:
+        print(f"🔍 Selected {len(filenames)} of {len(catalog)} exports")
+    # Oldest first, so a later export of the same visit and form wins
+    input_paths = oldest_first(os.path.join(input_dir, filename) for filename in filenames)
+    index = KeyIndex(output_dir)
+    # Files are read ahead on background threads while earlier ones are parsed
+    for input_path in prefetch(input_paths, args.prefetch):
+        filename = os.path.basename(input_path)
         print(f"\n📄 Processing file: {input_path}")
 
         form, processed_rows, error = process_file(
@@ -129,6 +187,7 @@ def main():
         if error:
             print(f"  ❌ Error processing {filename}: {error}")
             errors.append(f"{filename}: {error}")
+            failed_files.add(filename)
             skipped_count += 1
             continue
 
@@ -141,18 +200,24 @@ def main():
         normalized_form = form.lower().replace(" ", "_")
         print(f"  ✅ Detected form: {form} (normalized: {normalized_form})")
 
-        output_path = os.path.join(output_dir, f"{normalized_form}.csv")
-
-        if os.path.exists(output_path):
-            print("  ⚠️  Output file already exists. Skipping to avoid overwrite.")
+        output_path = form_output_path(output_dir, form)
+        try:
+            inserted, updated = write_output(output_path, processed_rows, index)
+        except ValueError as e:
+            print(f"  ❌ Error writing {output_path}: {e}")
+            errors.append(f"{filename}: {e}")
             skipped_count += 1
             continue
-
-        write_output(output_path, processed_rows)
+        if not inserted and not updated:
+            print("  ✅ Output already up to date.")
+            unchanged_count += 1
+            continue
+        print(f"  ✅ {inserted} new and {updated} updated answers in {output_path}")
         processed_count += 1
 
     print("\n------------------ Summary ------------------")
     print(f"✅ Files processed: {processed_count}")
+    print(f"✅ Files already up to date: {unchanged_count}")
     print(f"✅ Files saved to: {output_dir}")
     print(f"⚠️  Files skipped: {skipped_count}")
 
@@ -161,6 +226,44 @@ def main():
         for err in errors:
             print("  -", err)
 
+    # --- Watch for new exports ---
+    if args.watch:
+
+        def on_new_files(input_paths):
+            failed = []
+            for input_path in input_paths:
+                print(f"\n📄 New export: {input_path}")
+                form, processed_rows, error = process_file(
+                    input_path, args.skip_question, args.skip_status
+                )
+                if error:
+                    print(f"  ❌ Error processing {input_path}: {error}")
+                    # Possibly still being written: retried once the file changes
+                    failed.append(input_path)
+                    continue
+                if not processed_rows:
+                    print("  ⚠️  No data rows found after processing. Skipping file.")
+                    continue
+                output_path = form_output_path(output_dir, form)
+                try:
+                    inserted, updated = write_output(
+                        output_path, processed_rows, index, atomic=True
+                    )
+                except ValueError as e:
+                    print(f"  ❌ Error writing {output_path}: {e}")
+                    continue
+                print(f"  ✅ {inserted} new and {updated} updated answers in {output_path}")
+            return failed
+
+        watch_directory(
+            input_dir,
+            is_subject_export,
+            on_new_files,
+            known=[name for name in catalog if name not in failed_files],
+            interval=args.poll_interval,
+            poll=args.poll,
+        )
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,402 @@
+import os
+import csv
+import sqlite3
+import hashlib
+from array import array
+from checkpoint import CHECKPOINT_DIR
+from columnar import ColumnarTable
+from utils import append_csv_atomic
+
+UPSERTED_FILE = "upserted.txt"
+KEYS_FILE = "keys.sqlite"
+
+_KEYS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    path TEXT PRIMARY KEY,
+    header TEXT,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS records (
+    path TEXT,
+    key TEXT,
+    digest TEXT,
+    PRIMARY KEY (path, key)
+);
+"""
+
+# Keys looked up per query (SQLite limits the number of parameters)
+_LOOKUP_BATCH = 500
+
+
+def add_upsert_arguments(parser):
+    """Add the shared --upsert option to an extractor's argument parser."""
+    parser.add_argument(
+        "--upsert",
+        action="store_true",
+        help="Update the existing outputs by key with the files not seen yet, "
+        "instead of rewriting them from scratch.",
+    )
+
+
+def oldest_first(paths):
+    """
+    Sort input files by modification time, then name.
+
+    Files are upserted in this order, so when two reports give the same key
+    the most recent one wins, whatever order the directory lists them in.
+    """
+    return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+
+def file_signature(path):
+    """Return (size, mtime_ns) of a file, which changes when it is replaced."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _text(value):
+    """Return a value as csv.DictWriter writes it."""
+    return "" if value is None else str(value)
+
+
+def record_key(row, key_columns):
+    """Return the key of a row dict, as text."""
+    return tuple(_text(row.get(column)) for column in key_columns)
+
+
+def _digest(records):
+    """Return a digest of the rows of one key."""
+    text = "\x1e".join("\x1f".join(record) for record in records)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class KeyIndex:
+    """
+    SQLite side index of the keys in keyed CSV outputs.
+
+    For every key it keeps a digest of the rows, so upsert_csv() can tell
+    new, changed and unchanged keys apart with lookups instead of reading
+    the output. The header, size and modification time of each output are
+    recorded with its keys; an output changed by anything else (or written
+    before the index existed) is re-indexed from the file on its next upsert.
+
+    Args:
+        output_dir (str): Directory of the outputs; the index is kept in its
+            checkpoint directory.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        checkpoint_dir = os.path.join(output_dir, CHECKPOINT_DIR)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(checkpoint_dir, KEYS_FILE))
+        self.connection.executescript(_KEYS_SCHEMA)
+
+    def _path(self, file_path):
+        return os.path.relpath(file_path, self.output_dir)
+
+    def is_current(self, file_path, fieldnames):
+        """Return True if the output is exactly as the index last saw it."""
+        recorded = self.connection.execute(
+            "SELECT header, size, mtime_ns FROM outputs WHERE path = ?",
+            (self._path(file_path),),
+        ).fetchone()
+        if recorded is None or not os.path.isfile(file_path):
+            return False
+        return recorded == (",".join(fieldnames), *file_signature(file_path))
+
+    def digests(self, file_path, keys):
+        """Return key -> digest for the given keys present in the output."""
+        path = self._path(file_path)
+        by_text = {"\x1f".join(key): key for key in keys}
+        texts = list(by_text)
+        found = {}
+        for start in range(0, len(texts), _LOOKUP_BATCH):
+            batch = texts[start : start + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for key, digest in self.connection.execute(
+                f"SELECT key, digest FROM records WHERE path = ? AND key IN ({placeholders})",
+                (path, *batch),
+            ):
+                found[by_text[key]] = digest
+        return found
+
+    def update(self, file_path, fieldnames, records, reset=False):
+        """
+        Record the keys of `records` (key -> rows) and the current state of
+        the output. With `reset`, the keys recorded before are dropped.
+        """
+        path = self._path(file_path)
+        with self.connection:
+            if reset:
+                self.connection.execute("DELETE FROM records WHERE path = ?", (path,))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?)",
+                (
+                    (path, "\x1f".join(key), _digest(rows))
+                    for key, rows in records.items()
+                ),
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)",
+                (path, ",".join(fieldnames), *file_signature(file_path)),
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+def _drop_partial_line(file_path):
+    """Truncate a row left half-written by an interrupted in-place append."""
+    with open(file_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        tail_start = max(0, size - 65536)
+        f.seek(tail_start)
+        tail = f.read()
+        if not tail or tail.endswith(b"\n"):
+            return
+        f.truncate(tail_start + tail.rfind(b"\n") + 1)
+
+
+def _append(file_path, fieldnames, records, atomic):
+    """Append rows (lists of text) to an output, writing the header if it is new."""
+    if atomic:
+        append_csv_atomic(file_path, fieldnames, (dict(zip(fieldnames, r)) for r in records))
+        return
+    exists = os.path.isfile(file_path)
+    with open(file_path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if not exists:
+            writer.writerow(fieldnames)
+        writer.writerows(records)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _rewrite(file_path, fieldnames, key_columns, new):
+    """
+    Merge rows into an output by reading and replacing the whole file.
+
+    Returns:
+        tuple: (keys inserted, keys updated, every key -> rows of the result)
+    """
+    existing, header = [], None
+    if os.path.isfile(file_path):
+        _drop_partial_line(file_path)
+        with open(file_path, "r", newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            header = reader.fieldnames
+            missing = [c for c in key_columns if c not in (reader.fieldnames or [])]
+            if reader.fieldnames and missing:
+                raise ValueError(
+                    f"{file_path} has no {', '.join(missing)} column to key its rows "
+                    "by; remove it to rebuild it"
+                )
+            existing = [[row.get(column) or "" for column in fieldnames] for row in reader]
+
+    key_index = [fieldnames.index(column) for column in key_columns]
+    old, merged = {}, []
+    for record in existing:
+        key = tuple(record[i] for i in key_index)
+        if key not in new:
+            merged.append(record)
+            continue
+        if key not in old:
+            merged.extend(new[key])  # the new rows take the place of the first old one
+        old.setdefault(key, []).append(record)
+    merged.extend(record for key in new if key not in old for record in new[key])
+
+    inserted = sum(key not in old for key in new)
+    updated = sum(key in old and old[key] != new[key] for key in new)
+    if inserted or updated or header != fieldnames:
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(fieldnames)
+            writer.writerows(merged)
+        os.replace(tmp_path, file_path)
+
+    records = {}
+    for record in merged:
+        records.setdefault(tuple(record[i] for i in key_index), []).append(record)
+    return inserted, updated, records
+
+
+def upsert_records(file_path, fieldnames, key_columns, new, index=None, atomic=True):
+    """
+    Insert or replace the rows of keys in a keyed CSV output.
+
+    All existing rows of a key in `new` are replaced by its new rows, in
+    place; new keys are appended. With a KeyIndex that is current for the
+    output, the keys are looked up in the index: unchanged keys cost
+    nothing, and new keys are appended to the file, so a run that only
+    brings new records writes in proportion to them. Only when an existing
+    key changes (a corrected report) is the output read and replaced in one
+    rename; that costs one pass over the file. Without an index, or when the
+    output changed behind its back, every upsert takes that pass.
+
+    Args:
+        file_path (str): Output CSV file (created if missing).
+        fieldnames (list): Output columns.
+        key_columns (list): Columns identifying a record.
+        new (dict): key (tuple of text) -> rows (lists of text, in
+            `fieldnames` order).
+        index (KeyIndex): Key index of the output directory, or None.
+        atomic (bool): Append by replacing the file in one rename rather
+            than in place, for outputs read while being written.
+
+    Returns:
+        tuple: (keys inserted, keys updated)
+
+    Raises:
+        ValueError: If the existing output lacks a key column.
+    """
+    if not new:
+        return 0, 0
+
+    if index is not None and index.is_current(file_path, fieldnames):
+        old = index.digests(file_path, new)
+        inserted = [key for key in new if key not in old]
+        if all(old[key] == _digest(new[key]) for key in old):
+            if inserted:
+                _append(file_path, fieldnames, [r for key in inserted for r in new[key]], atomic)
+                index.update(file_path, fieldnames, {key: new[key] for key in inserted})
+            return len(inserted), 0
+        inserted, updated, _ = _rewrite(file_path, fieldnames, key_columns, new)
+        index.update(file_path, fieldnames, new)
+        return inserted, updated
+
+    inserted, updated, records = _rewrite(file_path, fieldnames, key_columns, new)
+    if index is not None and os.path.isfile(file_path):
+        index.update(file_path, fieldnames, records, reset=True)
+    return inserted, updated
+
+
+def upsert_csv(file_path, fieldnames, key_columns, rows, index=None, atomic=True):
+    """
+    Insert or replace row dicts in a keyed CSV output (see upsert_records()).
+
+    Keys of the dicts outside `fieldnames` are ignored. Within `rows`, all
+    rows of a key are kept together.
+
+    Returns:
+        tuple: (keys inserted, keys updated)
+    """
+    new = {}
+    for row in rows:
+        record = [_text(row.get(column)) for column in fieldnames]
+        new.setdefault(record_key(row, key_columns), []).append(record)
+    return upsert_records(file_path, fieldnames, key_columns, new, index, atomic)
+
+
+class KeyedWriter:
+    """
+    Upsert extraction results into keyed CSV outputs, in chunks.
+
+    Drop-in replacement for CheckpointedWriter when outputs are kept up to
+    date rather than rebuilt: rows of `chunk_size` input files are buffered
+    in columnar tables, then upserted with upsert_records() and a KeyIndex.
+    Within a chunk, the rows of a later file replace those of an earlier one
+    with the same key. The input files whose rows have been written are
+    listed in the checkpoint directory with their size and modification
+    time; done() skips them in later runs unless they changed, so a corrected
+    report saved under the same name is upserted again. Upserts are
+    idempotent, so a file re-run after a crash does not duplicate rows.
+
+    Args:
+        tables (dict): key -> (output path, fieldnames).
+        keys (dict): key -> columns identifying a record of that table.
+        output_dir (str): Directory where the checkpoint and key index are kept.
+        input_dir (str): Directory of the input files.
+        chunk_size (int): Input files per flush.
+
+    Set `atomic` to True when outputs are read while being written (watch
+    mode): new records are then appended by replacing the outputs in one
+    rename instead of in place.
+    """
+
+    def __init__(self, tables, keys, output_dir, input_dir, chunk_size=50):
+        self.tables = tables
+        self.keys = keys
+        self.input_dir = input_dir
+        self.chunk_size = max(1, chunk_size)
+        self.atomic = False
+        self.index = KeyIndex(output_dir)
+        self.upserted_path = os.path.join(output_dir, CHECKPOINT_DIR, UPSERTED_FILE)
+        self.processed = {}  # file name -> (size, mtime_ns) when upserted
+        if os.path.isfile(self.upserted_path):
+            with open(self.upserted_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    name, *signature = line.rstrip("\n").split("\t")
+                    if len(signature) == 2:
+                        self.processed[name] = tuple(int(v) for v in signature)
+        self.inserted = self.updated = 0
+        self._buffer = {
+            key: ColumnarTable(fieldnames) for key, (_, fieldnames) in tables.items()
+        }
+        self._sources = {key: array("I") for key in tables}  # row -> file in chunk
+        self._pending = []
+
+    def done(self, path):
+        """Return True if the input file was upserted and has not changed since."""
+        name = os.path.basename(path)
+        return name in self.processed and self.processed[name] == file_signature(path)
+
+    def add(self, filename, rows):
+        """Buffer the rows extracted from one input file (key -> ColumnarTable)."""
+        source = len(self._pending)
+        for key, table_rows in rows.items():
+            buffer = self._buffer[key]
+            if not len(buffer) and isinstance(table_rows, ColumnarTable):
+                # Encode the chunk as the extractor encodes its tables
+                buffer = self._buffer[key] = table_rows.empty_like(buffer.columns)
+            buffer.extend(table_rows)
+            self._sources[key].extend([source] * len(table_rows))
+        self._pending.append(
+            (filename, file_signature(os.path.join(self.input_dir, filename)))
+        )
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def _records(self, key):
+        """Return the buffered rows of a table by record key, latest file first."""
+        table = self._buffer[key]
+        columns = [[_text(value) for value in table.column(c)] for c in table.columns]
+        key_index = [table.columns.index(column) for column in self.keys[key]]
+        records, sources = {}, {}
+        for source, record in zip(self._sources[key], map(list, zip(*columns))):
+            record_key = tuple(record[i] for i in key_index)
+            if sources.get(record_key, source) < source:
+                records[record_key] = []  # drop the rows of an earlier file
+            sources[record_key] = source
+            records.setdefault(record_key, []).append(record)
+        return records
+
+    def flush(self):
+        """Upsert buffered rows into the outputs and record their input files."""
+        if not self._pending:
+            return
+        for key, (path, fieldnames) in self.tables.items():
+            if len(self._buffer[key]):
+                inserted, updated = upsert_records(
+                    path, fieldnames, self.keys[key], self._records(key),
+                    self.index, self.atomic,
+                )
+                self.inserted += inserted
+                self.updated += updated
+            self._buffer[key].clear()
+            self._sources[key] = array("I")
+
+        with open(self.upserted_path, "a", encoding="utf-8") as f:
+            f.writelines(
+                f"{name}\t{size}\t{mtime_ns}\n" for name, (size, mtime_ns) in self._pending
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        self.processed.update(self._pending)
+        self._pending = []
+
+    def close(self):
+        """Flush the remaining rows."""
+        self.flush()
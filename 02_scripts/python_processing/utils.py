@@ -1,5 +1,7 @@
-import chardet
+import os
 import csv
+import shutil
+import tempfile
 
 
 def load_nhc_mapping(file_path):
@@ -27,11 +29,18 @@ def detect_encoding(file_path, sample_size=1024):
     Returns:
         str: Detected encoding, or None if detection fails.
     """
+    import chardet
+
+    # Files read ahead by prefetch() carry their bytes
+    data = getattr(file_path, "data", None)
     try:
-        with open(file_path, "rb") as f:
-            raw_data = f.read(sample_size)
-            if not raw_data:
-                raise ValueError("File is empty or unreadable")
+        if data is not None:
+            raw_data = data[:sample_size]
+        else:
+            with open(file_path, "rb") as f:
+                raw_data = f.read(sample_size)
+        if not raw_data:
+            raise ValueError("File is empty or unreadable")
         result = chardet.detect(raw_data)
         encoding = result.get("encoding", None)
         # Treat 'ascii' as 'latin-1' (iso-8859-1)
@@ -44,8 +53,11 @@ def detect_encoding(file_path, sample_size=1024):
             )
             for fallback in ["utf-8", "latin-1"]:
                 try:
-                    with open(file_path, encoding=fallback) as test_f:
-                        test_f.read(100)
+                    if data is not None:
+                        data.decode(fallback)
+                    else:
+                        with open(file_path, encoding=fallback) as test_f:
+                            test_f.read(100)
                     return fallback
                 except Exception:
                     continue
@@ -54,3 +66,29 @@ def detect_encoding(file_path, sample_size=1024):
     except Exception as e:
         print(f"⚠️ Error detecting encoding for {file_path}: {e}")
         return None
+
+
+def append_csv_atomic(file_path, fieldnames, data_rows):
+    """
+    Append rows to a CSV file without ever exposing a partially written file.
+
+    The existing content is copied to a temporary file in the same directory,
+    the new rows are appended there and the result replaces the original in a
+    single rename. The header is written when the file does not exist yet.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as tmp:
+            exists = os.path.isfile(file_path)
+            if exists:
+                with open(file_path, "r", newline="", encoding="utf-8") as f:
+                    shutil.copyfileobj(f, tmp)
+            writer = csv.DictWriter(tmp, fieldnames=fieldnames, extrasaction="ignore")
+            if not exists:
+                writer.writeheader()
+            writer.writerows(data_rows)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
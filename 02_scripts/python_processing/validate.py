@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+import os
+import sys
+import glob
+import json
+import argparse
+from reconcile import to_numeric
+
+ID_PATTERN = r"HCB\d{3}"
+MISSING = ["", "NA"]
+VIOLATION_COLUMNS = ["table", "file", "row", "id", "check", "column", "value"]
+
+# Output table -> declarative checks, run column-wise over all its files.
+#   files     glob patterns under the data root
+#   columns   required columns (schema)
+#   rules     checks on the rows matching "where" (column -> value):
+#             type "numeric", range [min, max], units (whitelist of the
+#             "unit" column) or pattern (full-match regex) on "column"
+#             (default "value")
+#   required  values of "column" every patient must have
+# A JSON file passed with --rules is merged over these defaults.
+RULES = {
+    "haemogram": {
+        "files": ["automatic_extraction/blood_analysis/hematology/*.csv"],
+        "columns": ["id", "parameter", "value", "unit"],
+        "rules": [
+            {"column": "id", "pattern": ID_PATTERN},
+            {"type": "numeric"},
+            {"where": {"parameter": "Leucòcits"}, "range": [0.5, 100], "units": ["x10^9/L"]},
+            {"where": {"parameter": "Hemoglobina"}, "range": [30, 250], "units": ["g/L"]},
+            {"where": {"parameter": "Plaquetes"}, "range": [5, 2000], "units": ["x10^9/L"]},
+            {"where": {"parameter": "Eosinòfils"}, "units": ["x10^9/L", "%"]},
+            {"where": {"parameter": "Eosinòfils", "unit": "x10^9/L"}, "range": [0, 30]},
+            {"where": {"parameter": "Eosinòfils", "unit": "%"}, "range": [0, 100]},
+            {"where": {"parameter": "Neutròfils", "unit": "x10^9/L"}, "range": [0, 100]},
+            {"where": {"parameter": "Limfòcits", "unit": "x10^9/L"}, "range": [0, 100]},
+            {"where": {"parameter": "Monòcits", "unit": "x10^9/L"}, "range": [0, 30]},
+        ],
+        "required": {
+            "column": "parameter",
+            "values": ["Leucòcits", "Hemoglobina", "Eosinòfils"],
+        },
+    },
+    "ige_total": {
+        "files": ["automatic_extraction/blood_analysis/immunology/ige_total_auto.csv"],
+        "columns": ["id", "value"],
+        "rules": [
+            {"column": "id", "pattern": ID_PATTERN},
+            {"type": "numeric", "range": [0, 50000]},
+        ],
+    },
+    "ige_allergens": {
+        "files": [
+            "automatic_extraction/blood_analysis/immunology/ige_specific_auto.csv",
+            "automatic_extraction/blood_analysis/immunology/ige_recombinant_auto.csv",
+        ],
+        "columns": ["id", "allergen", "value", "unit"],
+        "rules": [
+            {"column": "id", "pattern": ID_PATTERN},
+            {"type": "numeric", "range": [0, 1000], "units": ["kUA/L", "kU/L"]},
+        ],
+    },
+    "spirometry": {
+        "files": ["automatic_extraction/spirometry/spirometry_auto.csv"],
+        "columns": ["id", "date", "parameter", "phase", "value_type", "value"],
+        "rules": [
+            {"column": "id", "pattern": ID_PATTERN},
+            {"type": "numeric"},
+            {"where": {"value_type": "%Teòric"}, "range": [5, 250]},
+            {"where": {"value_type": "Z-Score"}, "range": [-10, 10]},
+            {"where": {"value_type": "%change"}, "range": [-100, 300]},
+            {"where": {"parameter": "FVC(L)", "value_type": "raw"}, "range": [0.1, 10]},
+            {"where": {"parameter": "FEV1(L)", "value_type": "raw"}, "range": [0.1, 8]},
+            {"where": {"parameter": "FEV1/FVC(%)", "value_type": "raw"}, "range": [10, 100]},
+        ],
+        "required": {"column": "parameter", "values": ["FVC(L)", "FEV1(L)"]},
+    },
+    "spirometry_history": {
+        "files": ["automatic_extraction/spirometry/spirometry_history_auto.csv"],
+        "columns": ["id", "date", "parameter", "value"],
+        "rules": [
+            {"column": "id", "pattern": ID_PATTERN},
+            {"type": "numeric"},
+            {"column": "date", "pattern": r"\d{2}/\d{2}/\d{4}"},
+        ],
+    },
+    "lung_volumes": {
+        "files": ["automatic_extraction/spirometry/lung_volumes_auto.csv"],
+        "columns": ["id", "parameter", "unit", "value"],
+        "rules": [
+            {"column": "id", "pattern": ID_PATTERN},
+            {"type": "numeric", "units": ["L"]},
+            {"column": "pct_theorical", "range": [5, 300]},
+            {"where": {"parameter": "TLC"}, "range": [1, 15]},
+            {"where": {"parameter": "RV"}, "range": [0.2, 10]},
+            {"where": {"parameter": "FRC"}, "range": [0.5, 12]},
+        ],
+    },
+    "diffusion": {
+        "files": ["automatic_extraction/spirometry/diffusion_auto.csv"],
+        "columns": ["id", "parameter", "unit", "value"],
+        "rules": [
+            {"column": "id", "pattern": ID_PATTERN},
+            {"type": "numeric"},
+            {"column": "pct_theorical", "range": [5, 300]},
+            {"where": {"parameter": "DLCO"}, "range": [0.5, 80]},
+            {"where": {"parameter": "KCO"}, "range": [0.1, 10]},
+        ],
+    },
+    "macro": {
+        "files": ["macro_download/processed/*.csv"],
+        "columns": ["id", "visit", "question", "value", "status"],
+        "rules": [{"column": "id", "pattern": ID_PATTERN}],
+    },
+}
+
+
+def parse_arguments(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Check extracted blood, spirometry and MACRO outputs against plausibility rules."
+    )
+    parser.add_argument(
+        "raw_path",
+        help="Data root containing automatic_extraction/ and macro_download/.",
+    )
+    parser.add_argument("output_file", help="CSV file for the violations table.")
+    parser.add_argument(
+        "--rules", metavar="RULES_FILE", help="JSON file with additional or replaced table rules."
+    )
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="Stop at the first table with violations.",
+    )
+    return parser.parse_args(argv)
+
+
+def load_table(file_paths):
+    """
+    Load CSV outputs as text, with their file name and line number.
+    Repeated whitespace in values is collapsed, as in the R harmonization.
+    """
+    import pandas as pd
+
+    frames = []
+    for file_path in file_paths:
+        df = pd.read_csv(file_path, dtype=str, keep_default_na=False)
+        df = df.apply(lambda column: column.str.split().str.join(" "))
+        df["file"] = os.path.basename(file_path)
+        df["row"] = df.index + 2  # line number, after the header
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _violations(df, mask, table, check, column):
+    """Return the violations table for the rows of `df` flagged in `mask`."""
+    import pandas as pd
+
+    bad = df.loc[mask]
+    return pd.DataFrame(
+        {
+            "table": table,
+            "file": bad["file"],
+            "row": bad["row"],
+            "id": bad["id"] if "id" in bad else "",
+            "check": check,
+            "column": column,
+            "value": bad[column] if column in bad else "",
+        }
+    )
+
+
+def check_rule(df, table, rule, numeric):
+    """
+    Run one rule over the whole table at once and return its violations.
+    `numeric` caches the parsed numbers of each column across rules.
+    """
+    import pandas as pd
+
+    selected = pd.Series(True, index=df.index)
+    for column, value in rule.get("where", {}).items():
+        if column not in df:
+            return []
+        selected &= df[column] == value
+    column = rule.get("column", "value")
+    if column not in df or not selected.any():
+        return []
+
+    values = df[column]
+    present = selected & ~values.isin(MISSING)
+    found = []
+    if rule.get("type") == "numeric" or "range" in rule:
+        if column not in numeric:
+            numeric[column] = to_numeric(values)
+        numbers = numeric[column]
+        if rule.get("type") == "numeric":
+            found.append(_violations(df, present & numbers.isna(), table, "type", column))
+        if "range" in rule:
+            low, high = rule["range"]
+            outside = present & numbers.notna() & ~numbers.between(low, high)
+            found.append(_violations(df, outside, table, "range", column))
+    if "units" in rule and "unit" in df:
+        units = df["unit"]
+        wrong = present & ~units.isin(MISSING) & ~units.isin(rule["units"])
+        found.append(_violations(df, wrong, table, "unit", "unit"))
+    if "pattern" in rule:
+        wrong = selected & ~values.str.fullmatch(rule["pattern"])
+        found.append(_violations(df, wrong, table, "pattern", column))
+    return found
+
+
+def check_required(df, table, required):
+    """Return a violation for each patient missing a required value."""
+    import pandas as pd
+
+    column, values = required["column"], required["values"]
+    if column not in df:
+        return []
+    have = pd.crosstab(df["id"], df[column]).reindex(columns=values, fill_value=0)
+    missing = have.eq(0).stack()
+    missing = missing[missing].index.to_frame(index=False, name=["id", "value"])
+    return [
+        missing.assign(
+            table=table, file="", row=pd.NA, check="required", column=column
+        )[VIOLATION_COLUMNS]
+    ]
+
+
+def validate_table(df, table, spec):
+    """
+    Run the schema, rule and required-value checks of one table.
+
+    Returns:
+        pd.DataFrame: Violations, with VIOLATION_COLUMNS.
+    """
+    import pandas as pd
+
+    missing_columns = [c for c in spec.get("columns", []) if c not in df]
+    if missing_columns:
+        return pd.DataFrame(
+            [
+                {"table": table, "file": "", "check": "schema", "column": c}
+                for c in missing_columns
+            ],
+            columns=VIOLATION_COLUMNS,
+        )
+
+    found, numeric = [], {}
+    for rule in spec.get("rules", []):
+        found.extend(check_rule(df, table, rule, numeric))
+    if "required" in spec:
+        found.extend(check_required(df, table, spec["required"]))
+    found = [f for f in found if len(f)]
+    if not found:
+        return pd.DataFrame(columns=VIOLATION_COLUMNS)
+    return pd.concat(found, ignore_index=True)[VIOLATION_COLUMNS]
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    import pandas as pd
+
+    if not os.path.isdir(args.raw_path):
+        print(f"❌ Error: Data root '{args.raw_path}' does not exist.")
+        sys.exit(1)
+    rules = dict(RULES)
+    if args.rules:
+        with open(args.rules, "r", encoding="utf-8") as f:
+            rules.update(json.load(f))
+
+    results = []
+    for table, spec in rules.items():
+        file_paths = sorted(
+            f for pattern in spec["files"] for f in glob.glob(os.path.join(args.raw_path, pattern))
+        )
+        if not file_paths:
+            print(f"⚠️ {table}: no files found, skipping.")
+            continue
+        violations = validate_table(load_table(file_paths), table, spec)
+        print(f"{'❌' if len(violations) else '✅'} {table}: {len(violations)} violations")
+        results.append(violations)
+        if args.fail_fast and len(violations):
+            break
+
+    table = pd.concat(results, ignore_index=True) if results else pd.DataFrame(
+        columns=VIOLATION_COLUMNS
+    )
+    table.to_csv(args.output_file, index=False)
+    print(f"\n💾 Violations saved to {args.output_file}")
+
+    if len(table):
+        summary = table.groupby(["table", "check"]).size()
+        print("\n------------------ Violations ------------------")
+        print(summary.to_string())
+        sys.exit(1)
+    print("✅ All outputs passed validation.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# inotify event masks (see <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0x00000800
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def add_watch_arguments(parser):
+    """Add the shared --watch/--poll options to an extractor's argument parser."""
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the initial run, keep watching the input directory and append new files to the outputs.",
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="Use directory polling instead of inotify (needed on network shares).",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=2.0,
+        help="Seconds between directory checks in watch mode (default: 2).",
+    )
+
+
+def _open_inotify(directory):
+    """Create an inotify instance watching the directory for completed files."""
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    fd = libc.inotify_init1(IN_NONBLOCK)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {directory}")
+    return fd
+
+
+def _iter_inotify(fd, directory, interval):
+    """Yield batches of file names written or moved into the directory, using inotify."""
+    try:
+        # Files that arrived before the watch was registered
+        yield os.listdir(directory)
+        while True:
+            ready, _, _ = select.select([fd], [], [], interval)
+            if not ready:
+                continue
+            try:
+                buffer = os.read(fd, 64 * 1024)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    continue
+                raise
+            names, offset = [], 0
+            while offset < len(buffer):
+                _, _, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+                offset += _EVENT_HEADER.size
+                name = buffer[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if name:
+                    names.append(os.fsdecode(name))
+            yield names
+    finally:
+        os.close(fd)
+
+
+def _iter_polling(directory, interval):
+    """
+    Yield batches of file names found by polling the directory.
+
+    A file is only reported once its size is unchanged between two polls, so
+    copies still in progress on slow shares are not picked up half-written.
+    """
+    previous = {}
+    while True:
+        current = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    current[entry.name] = entry.stat().st_size
+        yield [
+            name for name, size in current.items() if previous.get(name) == size
+        ]
+        previous = current
+        time.sleep(interval)
+
+
+def _signature(directory, name):
+    """Return (size, mtime) of a file, or None if it is gone."""
+    try:
+        stat = os.stat(os.path.join(directory, name))
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def watch_directory(directory, match, callback, known=(), interval=2.0, poll=False):
+    """
+    Watch a directory and call `callback` with the paths of newly arrived files.
+
+    Args:
+        directory (str): Directory to watch.
+        match (callable): Predicate on the file name selecting the files to dispatch.
+        callback (callable): Called with a sorted list of new file paths. It may
+            return the paths that failed (e.g. a PDF still being written);
+            those are dispatched again once the file changes.
+        known (iterable): File names already processed, which are never dispatched.
+        interval (float): Seconds between checks.
+        poll (bool): Force polling instead of inotify.
+    """
+    seen = set(known)
+    failed = {}  # name -> (size, mtime) when it failed
+    source = None
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            source = _iter_inotify(_open_inotify(directory), directory, interval)
+            print(f"👀 Watching {directory} (inotify)")
+        except OSError as e:
+            print(f"⚠️ inotify unavailable ({e}), falling back to polling.")
+            source = None
+    if source is None:
+        source = _iter_polling(directory, interval)
+        print(f"👀 Watching {directory} (polling every {interval}s)")
+
+    try:
+        for names in source:
+            new_files = sorted(
+                name
+                for name in set(names)
+                if name not in seen
+                and match(name)
+                and failed.get(name) != _signature(directory, name)
+            )
+            if not new_files:
+                continue
+            seen.update(new_files)
+            for path in callback([os.path.join(directory, name) for name in new_files]) or ():
+                name = os.path.basename(path)
+                seen.discard(name)
+                failed[name] = _signature(directory, name)
+    except KeyboardInterrupt:
+        print("\n🛑 Watch stopped.")